@@ -0,0 +1,36 @@
+"""Url router of the REST API."""
+from django.urls import include, path
+
+from rest_framework import routers
+
+from resolwe.flow.views import (
+    CollectionViewSet,
+    ProcessViewSet,
+    DataViewSet,
+    DescriptorSchemaViewSet,
+    EntityViewSet,
+    StorageViewSet,
+    RelationViewSet,
+)
+
+from resolwe_server.base import views as base_views
+
+
+api_router = routers.DefaultRouter(
+    trailing_slash=False)  # pylint: disable=invalid-name
+api_router.register(r'collection', CollectionViewSet)
+api_router.register(r'entity', EntityViewSet)
+api_router.register(r'relation', RelationViewSet)
+api_router.register(r'process', ProcessViewSet)
+api_router.register(r'data', DataViewSet)
+api_router.register(r'descriptorschema', DescriptorSchemaViewSet)
+api_router.register(r'storage', StorageViewSet)
+api_router.register(r'user', base_views.UserViewSet, 'user')
+api_router.register(r'group', base_views.GroupViewSet, 'group')
+
+urlpatterns = [  # pylint: disable=invalid-name
+    path('api/queryobserver/', include('rest_framework_reactive.api_urls')),
+    path('api/', include((api_router.urls, 'resolwe-api'))),
+    path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    path('rest-auth/', include('rest_auth.urls')),
+]
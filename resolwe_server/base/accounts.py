@@ -0,0 +1,149 @@
+"""Account activation and password reset.
+
+Tokens identify the user and are only valid until the account state they
+were issued for changes, e.g. until the password is reset or the account
+is activated. Emails with tokens are sent by Celery tasks, see
+:mod:`resolwe_server.base.tasks`.
+
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.mail import EmailMessage
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+# Exports.
+__all__ = (
+    'activate_account',
+    'reset_password',
+    'send_activation_email',
+    'send_reset_email',
+)
+
+DEFAULTS = {
+    'RESET_URL': 'http://localhost:3000/reset-password/{token}',
+    'ACTIVATION_URL': 'http://localhost:3000/activate/{token}',
+    'RESET_SUBJECT': "Password reset",
+    'ACTIVATION_SUBJECT': "Account activation",
+}
+
+RESET_BODY = (
+    "Hello {username},\n\n"
+    "a password reset was requested for your account. To choose a new "
+    "password, visit:\n\n{url}\n\n"
+    "If you did not request a password reset, ignore this email.\n"
+)
+
+ACTIVATION_BODY = (
+    "Hello {username},\n\n"
+    "to activate your account, visit:\n\n{url}\n"
+)
+
+
+class ActivationTokenGenerator(PasswordResetTokenGenerator):
+    """Generate tokens invalidated by account activation."""
+
+    key_salt = 'resolwe_server.base.accounts.ActivationTokenGenerator'
+
+    def _make_hash_value(self, user, timestamp):
+        """Include activation state in the hash."""
+        return '{}{}{}'.format(user.pk, user.is_active, timestamp)
+
+
+reset_token_generator = PasswordResetTokenGenerator()  # pylint: disable=invalid-name
+activation_token_generator = ActivationTokenGenerator()  # pylint: disable=invalid-name
+
+
+def get_setting(name):
+    """Return account email setting ``name``."""
+    return getattr(settings, 'ACCOUNT_EMAILS', {}).get(name, DEFAULTS[name])
+
+
+def make_token(user, generator):
+    """Return token of ``generator`` identifying ``user``."""
+    # Generated tokens and encoded ids never contain a dot.
+    return '{}.{}'.format(
+        urlsafe_base64_encode(force_bytes(user.pk)), generator.make_token(user)
+    )
+
+
+def check_token(token, generator):
+    """Return user identified by a valid ``token`` of ``generator``.
+
+    :raises ValueError: if the token is not valid
+
+    """
+    user_model = get_user_model()
+    try:
+        uidb64, user_token = token.split('.', 1)
+        user = user_model.objects.get(pk=force_text(urlsafe_base64_decode(uidb64)))
+    except (TypeError, ValueError, OverflowError, user_model.DoesNotExist):
+        raise ValueError("Invalid token.")
+
+    if not generator.check_token(user, user_token):
+        raise ValueError("Invalid token.")
+
+    return user
+
+
+def build_reset_email(user, community=None):
+    """Return password reset email for ``user``."""
+    url = get_setting('RESET_URL').format(
+        token=make_token(user, reset_token_generator), community=community or ''
+    )
+    return EmailMessage(
+        subject=get_setting('RESET_SUBJECT'),
+        body=RESET_BODY.format(username=user.get_username(), url=url),
+        to=[user.email],
+    )
+
+
+def build_activation_email(user):
+    """Return account activation email for ``user``."""
+    url = get_setting('ACTIVATION_URL').format(
+        token=make_token(user, activation_token_generator)
+    )
+    return EmailMessage(
+        subject=get_setting('ACTIVATION_SUBJECT'),
+        body=ACTIVATION_BODY.format(username=user.get_username(), url=url),
+        to=[user.email],
+    )
+
+
+def send_reset_email(user, community=None):
+    """Queue password reset email for ``user``."""
+    from .tasks import send_reset_email as task
+
+    task.delay(user.pk, community)
+
+
+def send_activation_email(user):
+    """Queue account activation email for ``user``."""
+    from .tasks import send_activation_email as task
+
+    task.delay(user.pk)
+
+
+def reset_password(token, password):
+    """Set ``password`` of the user identified by reset ``token``.
+
+    :raises ValueError: if the token is not valid
+
+    """
+    user = check_token(token, reset_token_generator)
+    user.set_password(password)
+    user.save()
+    return user
+
+
+def activate_account(token):
+    """Activate account of the user identified by activation ``token``.
+
+    :raises ValueError: if the token is not valid
+
+    """
+    user = check_token(token, activation_token_generator)
+    user.is_active = True
+    user.save()
+    return user
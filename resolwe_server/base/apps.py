@@ -1,5 +1,5 @@
 """Application configuration."""
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
 
 
 class BaseConfig(AppConfig):
@@ -9,9 +9,29 @@ class BaseConfig(AppConfig):
 
     def ready(self):
         """Perform application initialization."""
+        # Register signal handlers.
+        from . import signals  # pylint: disable=unused-import
+
+        # Nodes not serving the REST API do not import its views.
+        if not apps.is_installed('rest_framework_reactive'):
+            return
+
         from rest_framework_reactive.decorators import observable
         from resolwe.flow import views as flow_views
 
-        flow_views.DataViewSet = observable(flow_views.DataViewSet)
-        flow_views.ProcessViewSet = observable(flow_views.ProcessViewSet)
+        from .response_cache import cached_responses
+        from .views.mixins import sparse_fieldsets
+
+        flow_views.CollectionViewSet = sparse_fieldsets(flow_views.CollectionViewSet)
+        flow_views.EntityViewSet = sparse_fieldsets(flow_views.EntityViewSet)
+        flow_views.DataViewSet = observable(sparse_fieldsets(flow_views.DataViewSet))
+        flow_views.ProcessViewSet = observable(
+            cached_responses(
+                flow_views.ProcessViewSet, ('process', 'permissions', 'membership')
+            )
+        )
+        flow_views.DescriptorSchemaViewSet = cached_responses(
+            flow_views.DescriptorSchemaViewSet,
+            ('descriptorschema', 'permissions', 'membership'),
+        )
         # flow_views.StorageViewSet = observable(flow_views.StorageViewSet)
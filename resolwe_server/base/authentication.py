@@ -0,0 +1,223 @@
+"""Cached authentication.
+
+Users of sessions and tokens are looked up in a short-lived in-process
+cache, then in the shared cache and only then in the database. When users
+or tokens change, their entries are removed from the shared cache and the
+removal is published on a Redis channel, so that every process removes
+them from its in-process cache too, e.g. after a user is deactivated or
+logs out. The in-process cache is only used while the process listens to
+the channel.
+
+Users are cached pickled, so every request gets its own instance and
+permissions cached on it by authentication backends do not leak between
+requests.
+
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from resolwe.utils import BraceMessage as __
+
+from .metrics import record_cache
+from .redis_clients import get_redis
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULTS = {
+    # Seconds entries are kept in the in-process cache.
+    'LOCAL_TIMEOUT': 10,
+    # Seconds entries are kept in the shared cache.
+    'TIMEOUT': 300,
+}
+
+USER_KEY = 'auth-user:{}'
+TOKEN_KEY = 'auth-token:{}'
+INVALIDATIONS_CHANNEL = 'auth-invalidations'
+
+# Maximum number of entries in the in-process cache.
+MAX_LOCAL_ENTRIES = 10000
+
+# Seconds between attempts to listen to invalidations after a failure.
+RECONNECT_DELAY = 5
+
+_local_cache = {}  # pylint: disable=invalid-name
+_local_lock = threading.Lock()  # pylint: disable=invalid-name
+# Processes of the started listener thread and of the subscribed one.
+_listener = {'started': None, 'listening': None}  # pylint: disable=invalid-name
+
+
+def get_setting(name):
+    """Return authentication cache setting ``name``."""
+    return getattr(settings, 'AUTH_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def _listen():
+    """Remove entries invalidated by other processes from the local cache."""
+    pid = os.getpid()
+    while True:
+        try:
+            pubsub = get_redis(key=INVALIDATIONS_CHANNEL).pubsub()
+            pubsub.subscribe(INVALIDATIONS_CHANNEL)
+            for message in pubsub.listen():
+                if message['type'] == 'subscribe':
+                    _listener['listening'] = pid
+                elif message['type'] == 'message':
+                    with _local_lock:
+                        _local_cache.pop(message['data'].decode('utf-8'), None)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(__("Listening to authentication invalidations failed: {}", error))
+
+        # Invalidations may have been missed.
+        _listener['listening'] = None
+        with _local_lock:
+            _local_cache.clear()
+        time.sleep(RECONNECT_DELAY)
+
+
+def _use_local_cache():
+    """Return whether the in-process cache is up to date."""
+    pid = os.getpid()
+    if _listener['started'] != pid:
+        with _local_lock:
+            if _listener['started'] != pid:
+                # Entries of the parent of a forked process are not trusted.
+                _local_cache.clear()
+                _listener['started'] = pid
+                threading.Thread(
+                    target=_listen, name='auth-invalidations', daemon=True
+                ).start()
+
+    return _listener['listening'] == pid
+
+
+def _cached(key, load):
+    """Return value of ``key`` from the caches or ``load()``.
+
+    ``None`` values are not cached.
+
+    """
+    now = time.monotonic()
+    use_local = _use_local_cache()
+    if use_local:
+        with _local_lock:
+            entry = _local_cache.get(key)
+        if entry is not None and entry[0] > now:
+            record_cache('auth', True)
+            return entry[1]
+
+    value = cache.get(key)
+    record_cache('auth', value is not None)
+    if value is None:
+        value = load()
+        if value is None:
+            return None
+        cache.set(key, value, get_setting('TIMEOUT'))
+
+    if use_local:
+        with _local_lock:
+            if len(_local_cache) >= MAX_LOCAL_ENTRIES:
+                _local_cache.clear()
+            _local_cache[key] = (now + get_setting('LOCAL_TIMEOUT'), value)
+    return value
+
+
+def _invalidate(key):
+    """Remove ``key`` from the caches of all processes."""
+    cache.delete(key)
+    with _local_lock:
+        _local_cache.pop(key, None)
+
+    try:
+        get_redis(key=INVALIDATIONS_CHANNEL).publish(INVALIDATIONS_CHANNEL, key)
+    except Exception as error:  # pylint: disable=broad-except
+        logger.warning(__("Publishing authentication invalidation failed: {}", error))
+
+
+def invalidate(key):
+    """Remove ``key`` from the shared and in-process caches."""
+    _invalidate(key)
+    # Entries may be cached from uncommitted data in the meantime.
+    transaction.on_commit(lambda: _invalidate(key))
+
+
+def invalidate_user(user_id):
+    """Remove user ``user_id`` from the caches."""
+    invalidate(USER_KEY.format(user_id))
+
+
+def invalidate_token(key):
+    """Remove token ``key`` from the caches."""
+    invalidate(TOKEN_KEY.format(key))
+
+
+def get_user(user_id):
+    """Return user ``user_id`` or ``None`` if it does not exist."""
+    user_model = get_user_model()
+
+    def load():
+        """Return pickled user from the database."""
+        try:
+            return pickle.dumps(
+                user_model._default_manager.get(  # pylint: disable=protected-access
+                    pk=user_id
+                )
+            )
+        except user_model.DoesNotExist:
+            return None
+
+    pickled = _cached(USER_KEY.format(user_id), load)
+    return pickle.loads(pickled) if pickled is not None else None
+
+
+def get_token_user_id(key):
+    """Return identifier of the user of token ``key`` or ``None``."""
+    def load():
+        """Return user identifier from the database."""
+        return (
+            Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+        )
+
+    return _cached(TOKEN_KEY.format(key), load)
+
+
+class CachedModelBackend(ModelBackend):
+    """Model backend loading users of sessions from the cache."""
+
+    def get_user(self, user_id):
+        """Return active user ``user_id`` or ``None``."""
+        user = get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication looking up tokens in the cache.
+
+    ``request.auth`` is the token key instead of the token instance.
+
+    """
+
+    def authenticate_credentials(self, key):
+        """Return user and token of ``key``."""
+        user_id = get_token_user_id(key)
+        user = get_user(user_id) if user_id is not None else None
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, key)
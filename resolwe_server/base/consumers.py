@@ -0,0 +1,267 @@
+"""Channels consumers."""
+import asyncio
+from collections import OrderedDict
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework_reactive.models import Subscriber
+from rest_framework_reactive.protocol import GROUP_SESSIONS
+
+# Exports.
+__all__ = ('CoalescingClientConsumer', 'get_coalescing_stats', 'reset_coalescing_stats')
+
+DEFAULTS = {
+    # Changes of an observer are collected for this many seconds after
+    # its last change ...
+    'DEBOUNCE': 0.5,
+    # ... but not for longer than this many seconds after the first one.
+    'MAX_WAIT': 2.0,
+    # Maximum sustained rate of messages sent to a subscriber per second.
+    'RATE': 20,
+    # Number of messages a subscriber may receive in a burst.
+    'BURST': 100,
+}
+
+STATS_KEY = 'reactive-coalescing:{}'
+# Local counters are added to the shared ones at most this often.
+STATS_INTERVAL = 10
+STATS_COUNTERS = ('received', 'sent', 'coalesced', 'throttled')
+
+
+def get_setting(name):
+    """Return coalescing setting ``name``."""
+    return getattr(settings, 'REACTIVE_COALESCING', {}).get(name, DEFAULTS[name])
+
+
+def get_coalescing_stats():
+    """Return counters of all coalescing client consumers."""
+    values = cache.get_many([STATS_KEY.format(name) for name in STATS_COUNTERS])
+    return {name: values.get(STATS_KEY.format(name), 0) for name in STATS_COUNTERS}
+
+
+def reset_coalescing_stats():
+    """Reset counters of all coalescing client consumers."""
+    cache.delete_many([STATS_KEY.format(name) for name in STATS_COUNTERS])
+
+
+def _add_stats(counts):
+    """Add ``counts`` to the shared counters."""
+    for name, count in counts.items():
+        if not count:
+            continue
+        key = STATS_KEY.format(name)
+        if not cache.add(key, count, None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, None)
+
+
+def merge_change(pending, action, item):
+    """Merge change ``action`` of ``item`` into ``pending`` changes.
+
+    Return ``True`` if the change replaced or cancelled an earlier one.
+
+    """
+    key = item['key']
+    previous = pending.pop(key, None)
+    if previous is None:
+        pending[key] = (action, item)
+        return False
+
+    previous_action = previous[0]
+    if previous_action == 'added' and action == 'removed':
+        # The client has never seen the item.
+        return True
+    if previous_action == 'added':
+        # Still new to the client, with the latest data.
+        action = 'added'
+    elif previous_action == 'removed' and action == 'added':
+        # The client still has the item.
+        action = 'changed'
+
+    pending[key] = (action, item)
+    return True
+
+
+class CoalescingClientConsumer(AsyncJsonWebsocketConsumer):
+    """Client consumer coalescing observer updates.
+
+    Replaces the ``ClientConsumer`` of ``rest_framework_reactive``. Changes
+    of each observer are collected during a debounce window and merged
+    per item, e.g. an item that is added and changed is sent once as
+    added, and an item that is added and removed is not sent at all.
+    Messages to a subscriber are limited by a token bucket; while the
+    bucket is empty, changes keep being merged.
+
+    Clients connecting with ``?batch=1`` receive all changes of an
+    observer in a single ``batch`` message instead of a message per item.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize state of pending updates."""
+        super().__init__(*args, **kwargs)
+        self.pending = {}
+        self.primary_keys = {}
+        self.first_change = {}
+        self.flush_handles = {}
+        self.tokens = float(get_setting('BURST'))
+        self.tokens_updated = time.monotonic()
+        self.stats = dict.fromkeys(STATS_COUNTERS, 0)
+        self.stats_saved = time.monotonic()
+        self.batch = False
+
+    async def websocket_connect(self, message):
+        """Called when WebSocket connection is established."""
+        self.session_id = self.scope['url_route']['kwargs']['subscriber_id']
+        query = parse_qs(self.scope.get('query_string', b'').decode('latin-1'))
+        self.batch = query.get('batch', ['0'])[-1] in ('1', 'true')
+        await super().websocket_connect(message)
+
+        # Create new subscriber object.
+        await database_sync_to_async(Subscriber.objects.get_or_create)(
+            session_id=self.session_id
+        )
+
+    @property
+    def groups(self):
+        """Groups this channel should add itself to."""
+        if not hasattr(self, 'session_id'):
+            return []
+
+        return [GROUP_SESSIONS.format(session_id=self.session_id)]
+
+    async def disconnect(self, code):
+        """Called when WebSocket connection is closed."""
+        for handle in self.flush_handles.values():
+            handle.cancel()
+        self.flush_handles = {}
+
+        await database_sync_to_async(
+            lambda: Subscriber.objects.filter(session_id=self.session_id).delete()
+        )()
+        await self.save_stats()
+
+    async def observer_update(self, message):
+        """Called when update from observer is received."""
+        observer = message['observer']
+        primary_key = message['primary_key']
+        self.primary_keys[observer] = primary_key
+        pending = self.pending.setdefault(observer, OrderedDict())
+
+        for action in ('added', 'changed', 'removed'):
+            for item in message[action]:
+                self.stats['received'] += 1
+                key = item['data'].get(primary_key)
+                if key is None:
+                    # Items without a key cannot be merged.
+                    key = object()
+                change = {
+                    'key': key,
+                    'order': item['order'],
+                    'data': item['data'],
+                }
+                if merge_change(pending, action, change):
+                    self.stats['coalesced'] += 1
+
+        now = time.monotonic()
+        self.first_change.setdefault(observer, now)
+        delay = min(
+            get_setting('DEBOUNCE'),
+            self.first_change[observer] + get_setting('MAX_WAIT') - now,
+        )
+        self.schedule_flush(observer, max(delay, 0))
+
+    def schedule_flush(self, observer, delay):
+        """Send pending changes of ``observer`` after ``delay`` seconds."""
+        handle = self.flush_handles.pop(observer, None)
+        if handle is not None:
+            handle.cancel()
+
+        loop = asyncio.get_event_loop()
+        self.flush_handles[observer] = loop.call_later(
+            delay, lambda: loop.create_task(self.flush(observer))
+        )
+
+    def take_tokens(self, count):
+        """Take ``count`` tokens from the bucket.
+
+        Return the number of seconds to wait if there are not enough.
+
+        """
+        now = time.monotonic()
+        rate = get_setting('RATE')
+        self.tokens = min(
+            float(get_setting('BURST')),
+            self.tokens + (now - self.tokens_updated) * rate,
+        )
+        self.tokens_updated = now
+
+        if self.tokens < 1:
+            return (1 - self.tokens) / rate
+
+        # A large flush may take the bucket below zero, which delays
+        # the following ones.
+        self.tokens -= count
+        return 0
+
+    async def flush(self, observer):
+        """Send pending changes of ``observer``."""
+        self.flush_handles.pop(observer, None)
+        pending = self.pending.get(observer)
+        if not pending:
+            self.first_change.pop(observer, None)
+            return
+
+        messages = 1 if self.batch else len(pending)
+        wait = self.take_tokens(messages)
+        if wait:
+            self.stats['throttled'] += 1
+            self.schedule_flush(observer, wait)
+            return
+
+        del self.pending[observer]
+        self.first_change.pop(observer, None)
+        primary_key = self.primary_keys[observer]
+
+        changes = [
+            {
+                'msg': action,
+                'observer': observer,
+                'primary_key': primary_key,
+                'order': item['order'],
+                'item': item['data'],
+            }
+            for action, item in pending.values()
+        ]
+        if self.batch:
+            await self.send_json(
+                {
+                    'msg': 'batch',
+                    'observer': observer,
+                    'primary_key': primary_key,
+                    'changes': changes,
+                }
+            )
+        else:
+            for change in changes:
+                await self.send_json(change)
+        self.stats['sent'] += messages
+
+        if time.monotonic() - self.stats_saved > STATS_INTERVAL:
+            await self.save_stats()
+
+    async def save_stats(self):
+        """Add local counters to the shared ones."""
+        counts, self.stats = self.stats, dict.fromkeys(STATS_COUNTERS, 0)
+        self.stats_saved = time.monotonic()
+        await sync_to_async(_add_stats)(counts)
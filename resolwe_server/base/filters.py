@@ -1,23 +1,38 @@
 """Django filters."""
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import json
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.contrib.postgres.fields import JSONField
 from django.core.exceptions import FieldDoesNotExist
-from django.db import connection
+from django.db.models import BooleanField, CharField, FloatField
 from django.db.models.expressions import RawSQL
 
-from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
 import django_filters as filters
 
 from resolwe.flow.filters import NUMBER_LOOKUPS, TEXT_LOOKUPS
 
+from . import json_paths
+from .search import search_users
+
+
+NUMERIC_SUFFIX = ':numeric'
+
 
 class JsonOrderingFilter(OrderingFilter):
     """Ordering filter for JSON fields.
 
-    Without proper indices, such orderings may be inefficient. All
-    JSON paths will be treated as strings.
+    Fields containing a dot are treated as JSON paths, e.g.
+    ``output.stats.words``. Values are ordered as strings unless the
+    path is suffixed with ``:numeric``, e.g. ``output.stats.words:numeric``.
+
+    Without proper indices, such orderings may be inefficient. Requested
+    paths are counted, so that the ``json_indexes`` management command
+    can create expression indexes for the most popular ones.
 
     """
 
@@ -34,6 +49,10 @@ class JsonOrderingFilter(OrderingFilter):
                 )
                 continue
 
+            numeric = field.endswith(NUMERIC_SUFFIX)
+            if numeric:
+                field = field[: -len(NUMERIC_SUFFIX)]
+
             path = field.split('.')
             base_field = path[0]
             if len(path) < 2:
@@ -50,26 +69,20 @@ class JsonOrderingFilter(OrderingFilter):
 
             # Resolve base field.
             try:
-                quote_name = connection.ops.quote_name
-                model_meta = queryset.model._meta  # pylint: disable=protected-access
-                base_field = '{}.{}'.format(
-                    quote_name(model_meta.db_table),
-                    quote_name(model_meta.get_field(base_field).column),
+                sql, params = json_paths.json_path_expression(
+                    queryset.model, base_field, path[1:], numeric=numeric
                 )
             except FieldDoesNotExist:
                 continue
 
-            placeholders = '->'.join(['%s'] * (len(path) - 2))
-            # The last placeholder should be accessed via the ->> operator.
-            if placeholders:
-                placeholders = '->{}->>%s'.format(placeholders)
-            else:
-                placeholders = '->>%s'
+            json_paths.record_path(queryset.model, base_field, path[1:], numeric)
 
             expression = RawSQL(
-                # We can use base_field here directly because we've resolved it via Django ORM.
-                '{}{}'.format(base_field, placeholders),
-                params=path[1:],
+                # We can use the SQL here directly because the base field
+                # has been resolved via Django ORM.
+                sql,
+                params=params,
+                output_field=FloatField() if numeric else CharField(),
             )
 
             if reverse:
@@ -80,6 +93,141 @@ class JsonOrderingFilter(OrderingFilter):
         return order_fields
 
 
+class JsonFilter(BaseFilterBackend):
+    """Filter backend for JSON fields.
+
+    Query parameters are JSON paths optionally followed by a lookup, e.g.
+    ``output.stats.words__gte=100``. Supported lookups are:
+
+    * ``exact`` (default) -- the value on the path is equal to the given
+      value, which is parsed as JSON if possible and used as a string
+      otherwise
+    * ``contains`` -- the value on the path contains the given JSON value
+    * ``has_key`` -- the object on the path has the given key; the path
+      may be omitted to check top-level keys, e.g. ``output__has_key=stats``
+    * ``gt``, ``gte``, ``lt``, ``lte`` -- numeric comparisons
+
+    Containment compiles to the ``@>`` operator and top-level key checks to
+    the ``?`` operator, which can use GIN indexes. Equality compares the
+    ``jsonb`` value on the path with ``=``, narrowed down by containment
+    first, so that it can use the same indexes. Numeric comparisons use
+    the same expressions as numeric JSON ordering, so they can use the
+    expression indexes created for it.
+
+    """
+
+    numeric_lookups = ('gt', 'gte', 'lt', 'lte')
+    lookups = ('exact', 'contains', 'has_key') + numeric_lookups
+
+    def _parse_param(self, queryset, param):
+        """Return field, path and lookup of a query parameter or ``None``."""
+        lookup = 'exact'
+        name = param
+        if '__' in param:
+            name, lookup = param.rsplit('__', 1)
+            if lookup not in self.lookups:
+                return None
+
+        path = name.split('.')
+        if len(path) < 2 and lookup not in ('contains', 'has_key'):
+            return None
+
+        try:
+            field = queryset.model._meta.get_field(  # pylint: disable=protected-access
+                path[0]
+            )
+        except FieldDoesNotExist:
+            return None
+
+        if not isinstance(field, JSONField):
+            return None
+
+        return path[0], path[1:], lookup
+
+    @staticmethod
+    def _alias(queryset):
+        """Return an unused name of an annotation of ``queryset``."""
+        return '_json_filter_{}'.format(len(queryset.query.annotations))
+
+    def _filter(self, queryset, param, field_name, path, lookup, value):
+        """Filter ``queryset`` by a single value."""
+        if lookup in self.numeric_lookups:
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValidationError({param: ["Enter a number."]})
+
+            sql, params = json_paths.json_path_expression(
+                queryset.model, field_name, path, numeric=True
+            )
+            json_paths.record_path(queryset.model, field_name, path, numeric=True)
+            alias = self._alias(queryset)
+            return queryset.annotate(
+                **{alias: RawSQL(sql, params, output_field=FloatField())}
+            ).filter(**{'{}__{}'.format(alias, lookup): value})
+
+        if lookup == 'has_key':
+            if not path:
+                return queryset.filter(**{'{}__has_key'.format(field_name): value})
+
+            # Keys of the path are passed as parameters, so that keys named
+            # like lookups or numbers are not interpreted by the ORM.
+            sql, params = json_paths.json_path_expression(
+                queryset.model, field_name, path, as_json=True
+            )
+            alias = self._alias(queryset)
+            return queryset.annotate(
+                **{
+                    alias: RawSQL(
+                        '{} ? %s'.format(sql),
+                        params + [value],
+                        output_field=BooleanField(),
+                    )
+                }
+            ).filter(**{alias: True})
+
+        try:
+            value = json.loads(value)
+        except ValueError:
+            if lookup == 'contains':
+                raise ValidationError({param: ["Enter a valid JSON value."]})
+
+        contained = value
+        for key in reversed(path):
+            contained = {key: contained}
+        queryset = queryset.filter(**{'{}__contains'.format(field_name): contained})
+        if lookup == 'contains':
+            return queryset
+
+        # Containment also matches arrays containing the value and objects
+        # with additional keys, so the value itself is compared as well.
+        sql, params = json_paths.json_path_expression(
+            queryset.model, field_name, path, as_json=True
+        )
+        alias = self._alias(queryset)
+        return queryset.annotate(
+            **{
+                alias: RawSQL(
+                    '{} = %s::jsonb'.format(sql),
+                    params + [json.dumps(value)],
+                    output_field=BooleanField(),
+                )
+            }
+        ).filter(**{alias: True})
+
+    def filter_queryset(self, request, queryset, view):
+        """Filter the queryset by JSON paths given in query parameters."""
+        for param in request.query_params:
+            parsed = self._parse_param(queryset, param)
+            if parsed is None:
+                continue
+
+            for value in request.query_params.getlist(param):
+                queryset = self._filter(queryset, param, *parsed, value=value)
+
+        return queryset
+
+
 class GroupFilter(filters.FilterSet):
     """Filter the Group endpoint."""
 
@@ -94,8 +242,14 @@ class GroupFilter(filters.FilterSet):
 
 
 class UserFilter(filters.FilterSet):
-    """Filter the User endpoint."""
+    """Filter the User endpoint.
 
+    ``search`` finds users by prefixes of and words similar to their
+    username, name, email, lab and company, best matches first.
+
+    """
+
+    search = filters.CharFilter(method='filter_search')
     job_title = filters.CharFilter(field_name='profile__job_title')
     company = filters.CharFilter(field_name='profile__company')
     department = filters.CharFilter(field_name='profile__department')
@@ -113,4 +267,8 @@ class UserFilter(filters.FilterSet):
             'username': TEXT_LOOKUPS[:],
             'first_name': TEXT_LOOKUPS[:],
             'last_name': TEXT_LOOKUPS[:],
-        }
\ No newline at end of file
+        }
+
+    def filter_search(self, queryset, name, value):
+        """Filter users matching the search text."""
+        return search_users(queryset, value)
@@ -0,0 +1,217 @@
+"""JSON path expressions, their usage statistics and expression indexes."""
+import hashlib
+import json
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+
+from resolwe.utils import BraceMessage as __
+
+from .redis_clients import get_redis
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Recorded paths are kept in a Redis hash of their descriptions and a
+# sorted set of their usage counts.
+KEY_PREFIX = 'json-paths'
+PATHS_KEY = KEY_PREFIX + ':paths'
+COUNTS_KEY = KEY_PREFIX + ':counts'
+
+# Paths given by clients are only recorded within these limits.
+MAX_PATHS = 1000
+MAX_PATH_DEPTH = 8
+MAX_KEY_LENGTH = 100
+
+# Count a use of a path, adding it to the recorded ones unless there
+# are too many already.
+RECORD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    if redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[3]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+redis.call('ZINCRBY', KEYS[2], 1, ARGV[1])
+return 1
+"""
+
+# Prefixes of names of indexes managed by the ``json_indexes`` command.
+INDEX_PREFIX = 'json_path_'
+GIN_INDEX_PREFIX = 'json_gin_'
+
+
+def json_path_expression(
+    model, field_name, path, numeric=False, qualify=True, as_json=False
+):
+    """Return SQL and parameters of an expression selecting a JSON path.
+
+    The expression selects the value on ``path`` (a list of keys) within
+    JSON field ``field_name`` of ``model`` as text, as ``jsonb`` when
+    ``as_json`` is set, or as a number when ``numeric`` is set, in which
+    case non-numeric values are ``NULL``.
+    The same expression is used by filters and expression indexes, so
+    that the indexes match the queries.
+
+    :raises FieldDoesNotExist: if ``field_name`` does not exist
+
+    """
+    quote_name = connection.ops.quote_name
+    model_meta = model._meta  # pylint: disable=protected-access
+    column = quote_name(model_meta.get_field(field_name).column)
+    if qualify:
+        column = '{}.{}'.format(quote_name(model_meta.db_table), column)
+
+    parents = ''.join('->%s' for _ in path[:-1])
+    if as_json:
+        return '{}{}->%s'.format(column, parents), list(path)
+
+    text_sql = '{}{}->>%s'.format(column, parents)
+    if not numeric:
+        return text_sql, list(path)
+
+    # Only numbers can be cast, other values are treated as missing.
+    sql = (
+        "CASE WHEN jsonb_typeof({}{}->%s) = 'number' "
+        "THEN ({})::double precision END".format(column, parents, text_sql)
+    )
+    return sql, list(path) * 2
+
+
+def _path_id(model_label, field_name, path, numeric):
+    """Return identifier of a JSON path."""
+    return hashlib.sha1(
+        json.dumps([model_label, field_name, path, numeric]).encode('utf-8')
+    ).hexdigest()[:16]
+
+
+def _get_redis():
+    """Return Redis client of recorded paths."""
+    return get_redis(key=KEY_PREFIX)
+
+
+def record_path(model, field_name, path, numeric=False):
+    """Count a request using the JSON path."""
+    if not getattr(settings, 'JSON_PATH_STATS', True):
+        return
+    if len(path) > MAX_PATH_DEPTH or any(len(key) > MAX_KEY_LENGTH for key in path):
+        return
+
+    model_label = model._meta.label  # pylint: disable=protected-access
+    description = json.dumps(
+        {
+            'model': model_label,
+            'field': field_name,
+            'path': list(path),
+            'numeric': numeric,
+        }
+    )
+    try:
+        _get_redis().eval(
+            RECORD_SCRIPT,
+            2,
+            PATHS_KEY,
+            COUNTS_KEY,
+            _path_id(model_label, field_name, path, numeric),
+            description,
+            MAX_PATHS,
+        )
+    except Exception as error:  # pylint: disable=broad-except
+        # Statistics must never break requests.
+        logger.warning(__("Recording JSON path usage failed: {}", error))
+
+
+def get_path_stats():
+    """Return recorded JSON paths, most used first."""
+    client = _get_redis()
+    paths = client.hgetall(PATHS_KEY)
+    counts = dict(client.zrange(COUNTS_KEY, 0, -1, withscores=True))
+    stats = []
+    for path_id, description in paths.items():
+        stats.append(
+            dict(
+                json.loads(description.decode('utf-8')),
+                id=path_id.decode('utf-8'),
+                count=int(counts.get(path_id, 0)),
+            )
+        )
+
+    return sorted(stats, key=lambda path: path['count'], reverse=True)
+
+
+def reset_path_stats():
+    """Forget all recorded JSON paths."""
+    _get_redis().delete(PATHS_KEY, COUNTS_KEY)
+
+
+def index_name(path):
+    """Return name of the expression index of a recorded ``path``."""
+    return '{}{}'.format(INDEX_PREFIX, path['id'])
+
+
+def existing_indexes():
+    """Return names of existing managed indexes."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE indexname LIKE %s",
+            [INDEX_PREFIX.replace('_', '\\_') + '%'],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def create_index(path):
+    """Create expression index for a recorded ``path``.
+
+    The index is built concurrently, so this must not run inside a
+    transaction.
+
+    """
+    model = apps.get_model(path['model'])
+    sql, params = json_path_expression(
+        model, path['field'], path['path'], numeric=path['numeric'], qualify=False
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (({}))'.format(
+                connection.ops.quote_name(index_name(path)),
+                connection.ops.quote_name(
+                    model._meta.db_table  # pylint: disable=protected-access
+                ),
+                sql,
+            ),
+            params,
+        )
+
+
+def drop_index(name):
+    """Drop managed index ``name``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(
+                connection.ops.quote_name(name)
+            )
+        )
+
+
+def create_gin_index(model_label, field_name):
+    """Create GIN index on JSON field ``field_name`` of model ``model_label``.
+
+    The index serves containment (``@>``) and top-level key existence
+    (``?``) lookups of :class:`~resolwe_server.base.filters.JsonFilter`.
+
+    """
+    model = apps.get_model(model_label)
+    model_meta = model._meta  # pylint: disable=protected-access
+    column = model_meta.get_field(field_name).column
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} USING GIN ({})'.format(
+                quote_name(
+                    '{}{}_{}'.format(GIN_INDEX_PREFIX, model_meta.db_table, column)
+                ),
+                quote_name(model_meta.db_table),
+                quote_name(column),
+            )
+        )
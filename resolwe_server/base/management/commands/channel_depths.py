@@ -0,0 +1,89 @@
+"""Show depths and metrics of channel layer channels."""
+import time
+
+from asgiref.sync import async_to_sync
+
+from channels.layers import get_channel_layer
+
+from django.core.management.base import BaseCommand, CommandError
+
+from resolwe_server.channel_layers import InstrumentedRedisChannelLayer
+
+
+class Command(BaseCommand):
+    """Show depths and metrics of channel layer channels."""
+
+    help = "Show depths and metrics of channel layer channels."
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help="seconds over which rates are measured (default: %(default)s)",
+        )
+        parser.add_argument(
+            '--watch', action='store_true', help="refresh until interrupted"
+        )
+        parser.add_argument(
+            'channels', nargs='*', help="channels to show in addition to known ones"
+        )
+
+    def handle(self, *args, **options):
+        """Run command."""
+        layer = get_channel_layer()
+        if not isinstance(layer, InstrumentedRedisChannelLayer):
+            raise CommandError(
+                "The default channel layer is not an InstrumentedRedisChannelLayer."
+            )
+
+        previous = async_to_sync(layer.get_metrics)()
+        while True:
+            time.sleep(options['interval'])
+            current = async_to_sync(layer.get_metrics)()
+            self.show(layer, options['channels'], previous, current, options['interval'])
+            previous = current
+            if not options['watch']:
+                break
+
+    def show(self, layer, extra_channels, previous, current, interval):
+        """Print depths, rates and latencies of channels."""
+        self.stdout.write(
+            "{:<50} {:>7} {:>9} {:>9} {:>9} {:>10} {:>10}".format(
+                "Channel", "Depth", "Capacity", "In/s", "Out/s", "Avg lat ms", "Delayed"
+            )
+        )
+        for channel in sorted(set(current) | set(extra_channels)):
+            values = current.get(channel, {})
+            before = previous.get(channel, {})
+
+            def rate(name):
+                """Return rate of counter ``name`` per second."""
+                # Counters expire and restart when channels are idle.
+                return max(values.get(name, 0) - before.get(name, 0), 0) / interval
+
+            if channel.startswith('group:'):
+                depth, capacity = '-', '-'
+            else:
+                depth = async_to_sync(layer.channel_depth)(channel)
+                capacity = layer.get_capacity(channel)
+
+            latency_count = values.get('latency_count', 0)
+            latency = (
+                '{:.1f}'.format(values.get('latency_ms', 0) / latency_count)
+                if latency_count
+                else '-'
+            )
+            self.stdout.write(
+                "{:<50} {:>7} {:>9} {:>9.1f} {:>9.1f} {:>10} {:>10}".format(
+                    channel,
+                    depth,
+                    capacity,
+                    rate('enqueued'),
+                    rate('dequeued'),
+                    latency,
+                    values.get('delayed', 0),
+                )
+            )
+        self.stdout.write("")
@@ -0,0 +1,97 @@
+"""Report where startup time of the server goes."""
+from collections import defaultdict
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Startup of a node: set up apps and load URL patterns like the first request.
+STARTUP_CODE = """
+import time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - start)
+"""
+
+# Line of ``-X importtime`` output: self and cumulative time in
+# microseconds, and the module name indented by its nesting level.
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    """Report where startup time of the server goes."""
+
+    help = "Report import times of server startup per package and module."
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            '--role',
+            choices=settings.DEPLOYMENT_ROLES,
+            default=settings.DEPLOYMENT_ROLE,
+            help="deployment role to start (default: %(default)s)",
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help="number of packages and modules to show (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        """Run command."""
+        if sys.version_info < (3, 7):
+            raise CommandError("Import times are reported by Python 3.7 and later.")
+
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'resolwe_server.settings'
+            ),
+            RESOLWE_DEPLOYMENT_ROLE=options['role'],
+        )
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if result.returncode:
+            raise CommandError("Startup failed:\n{}".format(result.stderr))
+
+        packages = defaultdict(int)
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_RE.match(line)
+            if not match:
+                continue
+            self_time, cumulative, indent, name = match.groups()
+            packages[name.split('.')[0]] += int(self_time)
+            modules.append((int(cumulative), len(indent) // 2, name))
+
+        total = float(result.stdout.strip().splitlines()[-1])
+        self.stdout.write(
+            "Startup of role '{}' took {:.0f} ms, {} modules imported in {:.0f} ms.".format(
+                options['role'],
+                total * 1000,
+                len(modules),
+                sum(packages.values()) / 1000,
+            )
+        )
+
+        self.stdout.write("\n{:<50} {:>10}".format("Package", "Self ms"))
+        for name, self_time in sorted(
+            packages.items(), key=lambda item: item[1], reverse=True
+        )[: options['limit']]:
+            self.stdout.write("{:<50} {:>10.1f}".format(name, self_time / 1000))
+
+        self.stdout.write("\n{:<50} {:>5} {:>10}".format("Module", "Depth", "Total ms"))
+        for cumulative, depth, name in sorted(modules, reverse=True)[: options['limit']]:
+            self.stdout.write("{:<50} {:>5} {:>10.1f}".format(name, depth, cumulative / 1000))
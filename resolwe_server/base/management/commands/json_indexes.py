@@ -0,0 +1,89 @@
+"""Manage expression indexes for popular JSON ordering paths."""
+from django.core.management.base import BaseCommand
+
+from resolwe_server.base import json_paths
+
+
+class Command(BaseCommand):
+    """Manage expression indexes for popular JSON ordering paths."""
+
+    help = (
+        "Show usage of JSON paths in ordering and create or drop expression "
+        "indexes for the most popular ones."
+    )
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            '--top', type=int, default=10, help="number of most used paths to index"
+        )
+        parser.add_argument(
+            '--min-count',
+            type=int,
+            default=100,
+            help="minimal number of requests for a path to be indexed",
+        )
+        parser.add_argument(
+            '--create', action='store_true', help="create indexes for the top paths"
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help="drop managed indexes of paths that are not among the top paths",
+        )
+        parser.add_argument(
+            '--reset', action='store_true', help="forget recorded path usage"
+        )
+        parser.add_argument(
+            '--gin',
+            nargs='+',
+            default=[],
+            metavar='APP.MODEL.FIELD',
+            help="create GIN indexes for JSON filtering on the given fields",
+        )
+
+    def handle(self, *args, **options):
+        """Run command."""
+        stats = json_paths.get_path_stats()
+        top = [
+            path
+            for path in stats[: options['top']]
+            if path['count'] >= options['min_count']
+        ]
+        top_names = {json_paths.index_name(path) for path in top}
+        existing = json_paths.existing_indexes()
+
+        for path in stats:
+            name = json_paths.index_name(path)
+            self.stdout.write(
+                "{:>10}  {}.{} {}{}{}".format(
+                    path['count'],
+                    path['model'],
+                    path['field'],
+                    '.'.join(path['path']),
+                    ' (numeric)' if path['numeric'] else '',
+                    ' [indexed]' if name in existing else '',
+                )
+            )
+
+        if options['create']:
+            for path in top:
+                name = json_paths.index_name(path)
+                if name in existing:
+                    continue
+                self.stdout.write("Creating index {}...".format(name))
+                json_paths.create_index(path)
+
+        if options['drop']:
+            for name in sorted(existing - top_names):
+                self.stdout.write("Dropping index {}...".format(name))
+                json_paths.drop_index(name)
+
+        for field in options['gin']:
+            model_label, field_name = field.rsplit('.', 1)
+            self.stdout.write("Creating GIN index on {}...".format(field))
+            json_paths.create_gin_index(model_label, field_name)
+
+        if options['reset']:
+            json_paths.reset_path_stats()
+            self.stdout.write("Path usage reset.")
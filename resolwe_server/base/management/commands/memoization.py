@@ -0,0 +1,47 @@
+"""Show or reset result memoization statistics."""
+from django.core.management.base import BaseCommand
+
+from resolwe_server.base import memoization
+
+
+class Command(BaseCommand):
+    """Show or reset result memoization statistics."""
+
+    help = "Show or reset result memoization statistics."
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            '--reset', action='store_true', help="reset hit and miss counters"
+        )
+        parser.add_argument(
+            '--evict',
+            type=int,
+            nargs='+',
+            default=[],
+            metavar='DATA_ID',
+            help="evict cache entries pointing to the given Data objects",
+        )
+
+    def handle(self, *args, **options):
+        """Run command."""
+        for data_id in options['evict']:
+            memoization.evict(data_id)
+
+        stats = memoization.get_stats()
+        lookups = stats['hits'] + stats['misses']
+        self.stdout.write("Enabled: {}".format(memoization.get_setting('ENABLED')))
+        self.stdout.write(
+            "Processes: {}".format(', '.join(memoization.get_setting('PROCESSES')))
+        )
+        self.stdout.write("Hits: {}".format(stats['hits']))
+        self.stdout.write("Misses: {}".format(stats['misses']))
+        self.stdout.write("Stale entries: {}".format(stats['stale']))
+        if lookups:
+            self.stdout.write(
+                "Hit ratio: {:.1%}".format(stats['hits'] / lookups)
+            )
+
+        if options['reset']:
+            memoization.reset_stats()
+            self.stdout.write("Counters reset.")
@@ -0,0 +1,30 @@
+"""Show or reset coalescing statistics of reactive websocket updates."""
+from django.core.management.base import BaseCommand
+
+from resolwe_server.base.consumers import get_coalescing_stats, reset_coalescing_stats
+
+
+class Command(BaseCommand):
+    """Show or reset coalescing statistics of reactive websocket updates."""
+
+    help = "Show or reset coalescing statistics of reactive websocket updates."
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument('--reset', action='store_true', help="reset counters")
+
+    def handle(self, *args, **options):
+        """Run command."""
+        stats = get_coalescing_stats()
+        self.stdout.write("Received item changes: {}".format(stats['received']))
+        self.stdout.write("Coalesced item changes: {}".format(stats['coalesced']))
+        self.stdout.write("Sent messages: {}".format(stats['sent']))
+        self.stdout.write("Throttled flushes: {}".format(stats['throttled']))
+        if stats['received']:
+            self.stdout.write(
+                "Coalesced ratio: {:.1%}".format(stats['coalesced'] / stats['received'])
+            )
+
+        if options['reset']:
+            reset_coalescing_stats()
+            self.stdout.write("Counters reset.")
@@ -0,0 +1,30 @@
+"""Watch files of Data objects with websocket clients and send their changes."""
+from django.core.management.base import BaseCommand, CommandError
+
+from resolwe_server.uploader.watcher import Watcher
+
+
+class Command(BaseCommand):
+    """Watch files of Data objects with websocket clients and send their changes."""
+
+    help = "Watch files of Data objects with websocket clients and send their changes."
+
+    def add_arguments(self, parser):
+        """Add command arguments."""
+        parser.add_argument(
+            '--backend',
+            choices=('auto', 'inotify', 'polling'),
+            help="change detection (default: the DATA_FILES_WATCHER setting)",
+        )
+
+    def handle(self, *args, **options):
+        """Run command."""
+        try:
+            watcher = Watcher(options['backend'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,297 @@
+"""Result memoization for deterministic processes.
+
+Data objects of processes listed in ``MEMOIZATION['PROCESSES']`` are
+keyed by the process slug and version, a content digest of their file
+inputs and a canonical form of the remaining inputs. When an earlier
+successful Data object with the same key exists, the new Data object is
+looked up before it is first saved and created as done with the outputs
+of the earlier one, so it is never dispatched to the executor. Once it is
+saved, it shares the data location and storages of the earlier one, like
+duplicated Data objects do.
+
+"""
+import hashlib
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from resolwe.flow.models import Data
+from resolwe.flow.utils import iterate_fields
+from resolwe.utils import BraceMessage as __
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+KEY_PREFIX = 'memoization'
+RESULT_KEY = KEY_PREFIX + ':result:{}'
+PENDING_KEY = KEY_PREFIX + ':pending:{}'
+SOURCE_KEY = KEY_PREFIX + ':source:{}'
+FILE_DIGEST_KEY = KEY_PREFIX + ':file:{}'
+STATS_KEY = KEY_PREFIX + ':stats:{}'
+
+DIGEST_BLOCK_SIZE = 1024 * 1024
+
+DEFAULTS = {
+    'ENABLED': False,
+    'PROCESSES': [],
+    'TIMEOUT': 7 * 24 * 3600,
+    'BYPASS_TAG': 'memoization:bypass',
+}
+
+
+def get_setting(name):
+    """Return memoization setting ``name``."""
+    return getattr(settings, 'MEMOIZATION', {}).get(name, DEFAULTS[name])
+
+
+def is_memoizable(data):
+    """Return ``True`` if results of ``data`` may be served from cache."""
+    if not get_setting('ENABLED'):
+        return False
+
+    if data.process.slug not in get_setting('PROCESSES'):
+        return False
+
+    return get_setting('BYPASS_TAG') not in (getattr(data, 'tags', None) or [])
+
+
+def _increment(name):
+    """Increment statistics counter ``name``."""
+    key = STATS_KEY.format(name)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter has been evicted between the two calls.
+        cache.set(key, 1, None)
+
+
+def get_stats():
+    """Return hit and miss counters."""
+    names = ('hits', 'misses', 'stale')
+    values = cache.get_many([STATS_KEY.format(name) for name in names])
+    return {name: values.get(STATS_KEY.format(name), 0) for name in names}
+
+
+def reset_stats():
+    """Reset hit and miss counters."""
+    cache.delete_many(
+        [STATS_KEY.format(name) for name in ('hits', 'misses', 'stale')]
+    )
+
+
+def file_digest(path):
+    """Return SHA-256 digest of the file on ``path``.
+
+    Digests are cached by path, size and modification time, so repeated
+    lookups of the same input do not reread the file.
+
+    """
+    stat = os.stat(path)
+    key = FILE_DIGEST_KEY.format(
+        hashlib.sha1(
+            '{}:{}:{}'.format(path, stat.st_size, stat.st_mtime_ns).encode('utf-8')
+        ).hexdigest()
+    )
+    digest = cache.get(key)
+    if digest is not None:
+        return digest
+
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(DIGEST_BLOCK_SIZE), b''):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+
+    cache.set(key, digest, get_setting('TIMEOUT'))
+    return digest
+
+
+def _upload_digest(value):
+    """Return digest of an uploaded file input or ``None``."""
+    if not value.get('file_temp'):
+        return None
+
+    path = os.path.join(settings.FLOW_EXECUTOR['UPLOAD_DIR'], value['file_temp'])
+    if not os.path.isfile(path):
+        return None
+
+    return {'file': value.get('file'), 'digest': file_digest(path)}
+
+
+def _data_digest(data_id):
+    """Return digest of outputs of Data object with ``data_id`` or ``None``."""
+    try:
+        data = Data.objects.select_related('process', 'location').get(pk=data_id)
+    except Data.DoesNotExist:
+        return None
+
+    if data.status != Data.STATUS_DONE or data.location is None:
+        return None
+
+    output = {}
+    for schema, fields, path in iterate_fields(
+        data.output, data.process.output_schema, ''
+    ):
+        value = fields[schema['name']]
+        if schema['type'].startswith('basic:file:'):
+            value = [value]
+        elif not schema['type'].startswith('list:basic:file:'):
+            output[path] = value
+            continue
+
+        digests = []
+        for item in value:
+            file_path = data.location.get_path(filename=item['file'])
+            if not os.path.isfile(file_path):
+                return None
+            digests.append(file_digest(file_path))
+        output[path] = digests
+
+    return {
+        'process': [data.process.slug, str(data.process.version)],
+        'output': output,
+    }
+
+
+def compute_key(data):
+    """Return memoization key of ``data`` or ``None`` if it has none."""
+    inputs = {}
+    for schema, fields, path in iterate_fields(
+        data.input, data.process.input_schema, ''
+    ):
+        value = fields[schema['name']]
+        field_type = schema['type']
+
+        if field_type.startswith(('basic:dir:', 'list:basic:dir:')):
+            # Directory inputs are not supported.
+            return None
+
+        digest = None
+        if field_type.startswith('basic:file:'):
+            digest = [_upload_digest(value)]
+        elif field_type.startswith('list:basic:file:'):
+            digest = [_upload_digest(item) for item in value]
+        elif field_type.startswith('data:'):
+            digest = [_data_digest(value)]
+        elif field_type.startswith('list:data:'):
+            digest = [_data_digest(item) for item in value]
+
+        if digest is not None:
+            if None in digest:
+                return None
+            value = digest if field_type.startswith('list:') else digest[0]
+
+        inputs[path] = value
+
+    canonical = json.dumps(
+        {
+            'process': [data.process.slug, str(data.process.version)],
+            'input': inputs,
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _apply_hit(data, cached):
+    """Populate unsaved ``data`` with outputs of ``cached``."""
+    now = timezone.now()
+    values = {
+        'output': cached.output,
+        'size': cached.size,
+        'status': Data.STATUS_DONE,
+        'process_progress': 100,
+        'process_rc': 0,
+        'started': now,
+        'finished': now,
+    }
+    for name, value in values.items():
+        setattr(data, name, value)
+    data._memoized_from = cached.pk  # pylint: disable=protected-access
+
+
+def lookup(data):
+    """Serve ``data`` from cache before it is first saved if possible.
+
+    Return ``True`` on a cache hit, in which case ``data`` is populated
+    with the outputs of the cached Data object and saved as done, so that
+    the manager never dispatches it. On a miss, the key is remembered so
+    that the result is stored once ``data`` is done. Call :func:`created`
+    once ``data`` is saved.
+
+    """
+    key = compute_key(data)
+    if key is None:
+        return False
+
+    cached_id = cache.get(RESULT_KEY.format(key))
+    if cached_id is not None:
+        # Data objects without a location have no files to share.
+        cached = Data.objects.filter(
+            pk=cached_id, status=Data.STATUS_DONE, location__isnull=False
+        ).first()
+        if cached is not None:
+            _apply_hit(data, cached)
+            _increment('hits')
+            return True
+
+        # The cached Data object has been removed or rerun.
+        cache.delete(RESULT_KEY.format(key))
+        _increment('stale')
+
+    _increment('misses')
+    data._memoization_key = key  # pylint: disable=protected-access
+    return False
+
+
+def created(data):
+    """Share data of the Data object ``data`` is served from or remember its key."""
+    key = getattr(data, '_memoization_key', None)
+    if key is not None:
+        cache.set(PENDING_KEY.format(data.pk), key, get_setting('TIMEOUT'))
+
+    cached_id = getattr(data, '_memoized_from', None)
+    if cached_id is None:
+        return
+
+    cached = Data.objects.select_related('location').filter(pk=cached_id).first()
+    if cached is None:
+        logger.warning(
+            __("Cached Data {} of Data {} has been removed.", cached_id, data.pk)
+        )
+        return
+
+    # Share files and JSON storages the same way as Data.duplicate does.
+    if cached.location is not None:
+        cached.location.data.add(data)  # pylint: disable=no-member
+    data.storages.set(cached.storages.all())  # pylint: disable=no-member
+    logger.info(__("Data {} served from cached Data {}.", data.pk, cached_id))
+
+
+def store(data):
+    """Store results of finished ``data`` if they were requested."""
+    pending_key = PENDING_KEY.format(data.pk)
+    key = cache.get(pending_key)
+    if key is None:
+        return
+
+    cache.delete(pending_key)
+    if data.status != Data.STATUS_DONE:
+        return
+
+    timeout = get_setting('TIMEOUT')
+    cache.set(RESULT_KEY.format(key), data.pk, timeout)
+    cache.set(SOURCE_KEY.format(data.pk), key, timeout)
+
+
+def evict(data_id):
+    """Evict the cache entry pointing to Data object with ``data_id``."""
+    key = cache.get(SOURCE_KEY.format(data_id))
+    cache.delete_many([SOURCE_KEY.format(data_id), PENDING_KEY.format(data_id)])
+    if key is not None and cache.get(RESULT_KEY.format(key)) == data_id:
+        cache.delete(RESULT_KEY.format(key))
@@ -0,0 +1,325 @@
+"""Request metrics.
+
+:class:`MetricsMiddleware` records, per URL route and method, request
+latency histograms, SQL query counts and time, cache hits and misses
+and request and response sizes. Metrics are accumulated in memory and
+periodically added to a Redis hash shared by all processes, which the
+metrics endpoint renders in the Prometheus text format.
+
+When the ``METRICS`` setting disables them, the middleware is removed
+from the request handling chain altogether. Otherwise only a sample of
+requests is measured, and the recorded values are scaled up accordingly.
+
+"""
+from collections import defaultdict
+from contextlib import ExitStack
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse
+
+from resolwe.utils import BraceMessage as __
+
+from .redis_clients import get_redis
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Fraction of requests that are measured.
+    'SAMPLE_RATE': 1.0,
+    # Seconds between writes of metrics of a process to Redis.
+    'FLUSH_INTERVAL': 10,
+    # Bearer token of scrapers of the metrics endpoint.
+    'TOKEN': None,
+}
+
+METRICS_KEY = 'resolwe-metrics'
+
+# Upper bounds of latency histogram buckets in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = {
+    'resolwe_http_requests_total': ('counter', "Number of requests."),
+    'resolwe_http_request_duration_seconds': (
+        'histogram',
+        "Request latency in seconds.",
+    ),
+    'resolwe_http_sql_queries_total': ('counter', "Number of SQL queries."),
+    'resolwe_http_sql_duration_seconds_total': (
+        'counter',
+        "Time spent in SQL queries in seconds.",
+    ),
+    'resolwe_http_cache_hits_total': ('counter', "Number of cache hits."),
+    'resolwe_http_cache_misses_total': ('counter', "Number of cache misses."),
+    'resolwe_http_request_bytes_total': ('counter', "Size of request bodies."),
+    'resolwe_http_response_bytes_total': ('counter', "Size of response bodies."),
+}
+
+_local = threading.local()  # pylint: disable=invalid-name
+_pending = defaultdict(float)  # pylint: disable=invalid-name
+_pending_lock = threading.Lock()  # pylint: disable=invalid-name
+_last_flush = time.monotonic()  # pylint: disable=invalid-name
+
+
+def get_setting(name):
+    """Return metrics setting ``name``."""
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+def _field(name, labels):
+    """Return Redis hash field of metric ``name`` with ``labels``."""
+    return json.dumps([name, labels], sort_keys=True)
+
+
+def _add(name, labels, value):
+    """Add ``value`` to metric ``name`` with ``labels``."""
+    if value:
+        with _pending_lock:
+            _pending[_field(name, labels)] += value
+
+
+def record_cache(cache_name, hit):
+    """Record a hit or a miss of cache ``cache_name`` in the current request."""
+    sample = getattr(_local, 'sample', None)
+    if sample is not None:
+        sample['cache_hits' if hit else 'cache_misses'][cache_name] += 1
+
+
+def flush(force=False):
+    """Add metrics of this process to the shared ones."""
+    global _last_flush  # pylint: disable=global-statement,invalid-name
+    with _pending_lock:
+        now = time.monotonic()
+        if not force and now - _last_flush < get_setting('FLUSH_INTERVAL'):
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = now
+
+    if not pending:
+        return
+
+    try:
+        pipeline = get_redis(key=METRICS_KEY).pipeline(transaction=False)
+        for field, value in pending.items():
+            pipeline.hincrbyfloat(METRICS_KEY, field, value)
+        pipeline.execute()
+    except Exception as error:  # pylint: disable=broad-except
+        # Metrics must never break requests.
+        logger.warning(__("Storing request metrics failed: {}", error))
+
+
+def reset():
+    """Forget all recorded metrics."""
+    with _pending_lock:
+        _pending.clear()
+    get_redis(key=METRICS_KEY).delete(METRICS_KEY)
+
+
+def _escape(value):
+    """Escape Prometheus label ``value``."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    """Format sample ``value``."""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def render():
+    """Return recorded metrics in the Prometheus text format."""
+    values = get_redis(key=METRICS_KEY).hgetall(METRICS_KEY)
+    samples = defaultdict(list)
+    for field, value in values.items():
+        name, labels = json.loads(field.decode('utf-8'))
+        samples[name].append((labels, float(value)))
+
+    lines = []
+    for family, (metric_type, description) in METRICS.items():
+        names = [family]
+        if metric_type == 'histogram':
+            names = [family + suffix for suffix in ('_bucket', '_sum', '_count')]
+        if not any(samples.get(name) for name in names):
+            continue
+
+        lines.append('# HELP {} {}'.format(family, description))
+        lines.append('# TYPE {} {}'.format(family, metric_type))
+        for name in names:
+            for labels, value in sorted(
+                samples.get(name, []), key=lambda sample: sorted(sample[0].items())
+            ):
+                label_text = ','.join(
+                    '{}="{}"'.format(key, _escape(labels[key])) for key in sorted(labels)
+                )
+                lines.append('{}{{{}}} {}'.format(name, label_text, _format_value(value)))
+
+    return '\n'.join(lines) + '\n'
+
+
+def get_route(request):
+    """Return URL route of ``request``."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route or match.view_name or 'unknown'
+
+
+class QueryRecorder:
+    """Database execute wrapper counting queries of a request."""
+
+    def __init__(self, sample):
+        """Initialize recorder."""
+        self.sample = sample
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute and time the query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sample['queries'] += 1
+            self.sample['query_time'] += time.perf_counter() - start
+
+
+def _get_streamed_size(response):
+    """Return size of streamed ``response`` if known without reading it."""
+    if response.has_header('Content-Length'):
+        try:
+            return int(response['Content-Length'])
+        except ValueError:
+            pass
+
+    file_to_stream = getattr(response, 'file_to_stream', None)
+    if file_to_stream is not None:
+        try:
+            return os.fstat(file_to_stream.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            pass
+
+    return None
+
+
+def _count_bytes(content, labels, weight):
+    """Yield streamed ``content`` and record its size when done."""
+    size = 0
+    try:
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _add('resolwe_http_response_bytes_total', labels, size * weight)
+
+
+class MetricsMiddleware:
+    """Record metrics of sampled requests."""
+
+    def __init__(self, get_response):
+        """Initialize middleware."""
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.sample_rate = get_setting('SAMPLE_RATE')
+
+    def __call__(self, request):
+        """Handle request."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        sample = {
+            'queries': 0,
+            'query_time': 0.0,
+            'cache_hits': defaultdict(int),
+            'cache_misses': defaultdict(int),
+        }
+        _local.sample = sample
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(QueryRecorder(sample)))
+                response = self.get_response(request)
+        finally:
+            _local.sample = None
+        duration = time.perf_counter() - start
+
+        self.record(request, response, duration, sample)
+        flush()
+        return response
+
+    def record(self, request, response, duration, sample):
+        """Record metrics of a request."""
+        weight = 1 / self.sample_rate
+        labels = {'route': get_route(request), 'method': request.method}
+
+        _add(
+            'resolwe_http_requests_total',
+            dict(labels, status=str(response.status_code)),
+            weight,
+        )
+        for bound in LATENCY_BUCKETS:
+            if duration <= bound:
+                _add(
+                    'resolwe_http_request_duration_seconds_bucket',
+                    dict(labels, le=str(bound)),
+                    weight,
+                )
+        _add(
+            'resolwe_http_request_duration_seconds_bucket',
+            dict(labels, le='+Inf'),
+            weight,
+        )
+        _add('resolwe_http_request_duration_seconds_sum', labels, duration * weight)
+        _add('resolwe_http_request_duration_seconds_count', labels, weight)
+
+        _add('resolwe_http_sql_queries_total', labels, sample['queries'] * weight)
+        _add(
+            'resolwe_http_sql_duration_seconds_total',
+            labels,
+            sample['query_time'] * weight,
+        )
+        for cache_name, count in sample['cache_hits'].items():
+            _add(
+                'resolwe_http_cache_hits_total',
+                dict(labels, cache=cache_name),
+                count * weight,
+            )
+        for cache_name, count in sample['cache_misses'].items():
+            _add(
+                'resolwe_http_cache_misses_total',
+                dict(labels, cache=cache_name),
+                count * weight,
+            )
+
+        try:
+            request_bytes = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            request_bytes = 0
+        _add('resolwe_http_request_bytes_total', labels, request_bytes * weight)
+
+        if response.streaming:
+            size = _get_streamed_size(response)
+            if size is not None:
+                _add('resolwe_http_response_bytes_total', labels, size * weight)
+            elif not isinstance(response, FileResponse):
+                # File responses are left intact, so that the server can send
+                # their files with its file wrapper.
+                response.streaming_content = _count_bytes(
+                    response.streaming_content, labels, weight
+                )
+        else:
+            _add(
+                'resolwe_http_response_bytes_total',
+                labels,
+                len(response.content) * weight,
+            )
@@ -0,0 +1,32 @@
+"""Trigram indexes of user search."""
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_indexes(apps, schema_editor):
+    """Create trigram indexes of searched user fields."""
+    from resolwe_server.base import search
+
+    search.create_indexes()
+
+
+def drop_indexes(apps, schema_editor):
+    """Drop trigram indexes of searched user fields."""
+    from resolwe_server.base import search
+
+    search.drop_indexes()
+
+
+class Migration(migrations.Migration):
+    """Create trigram indexes of user search."""
+
+    # Indexes are built concurrently, which is not possible in a transaction.
+    atomic = False
+
+    dependencies = [migrations.swappable_dependency(settings.AUTH_USER_MODEL)]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,273 @@
+"""Pagination classes."""
+import base64
+from collections import OrderedDict
+import datetime
+import decimal
+import json
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.db.models.expressions import Col, OrderBy
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_key_value(value):
+    """Encode key values that are not supported by JSON.
+
+    Unlike ``DjangoJSONEncoder``, keep the full precision of times.
+
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError("Unsupported key value: {!r}".format(value))
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """Limit/offset pagination with optional keyset pagination.
+
+    Requests with a ``cursor`` query parameter or with ``pagination=keyset``
+    are paginated by keyset: each page continues after the last row of
+    the previous one instead of skipping ``offset`` rows, so deep pages
+    are as cheap as the first one. The current ordering, including
+    orderings by JSON paths, is used as the key, with the primary key
+    appended as a unique tiebreaker. Responses contain opaque ``next``
+    and ``previous`` cursor links and no total count.
+
+    Other requests are paginated by limit and offset as before.
+
+    """
+
+    cursor_query_param = 'cursor'
+    pagination_query_param = 'pagination'
+    keyset_default_limit = 100
+    invalid_cursor_message = "Invalid cursor."
+
+    annotation_prefix = '_keyset_'
+
+    def __init__(self):
+        """Initialize paginator state."""
+        super().__init__()
+        self.keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Paginate ``queryset``."""
+        self.keyset = (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.pagination_query_param) == 'keyset'
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request) or self.keyset_default_limit
+
+        keys = self.get_keys(queryset)
+        if keys is None:
+            raise NotFound("Keyset pagination does not support random ordering.")
+
+        position, self.reverse = self.decode_cursor(request, len(keys))
+
+        annotations = {}
+        ordering = []
+        for index, (expression, descending) in enumerate(keys):
+            name = '{}{}'.format(self.annotation_prefix, index)
+            annotations[name] = expression
+            if self.reverse:
+                descending = not descending
+            ordering.append(F(name).desc() if descending else F(name).asc())
+
+        queryset = queryset.annotate(**annotations).order_by(*ordering)
+        self.names = list(annotations)
+        resolved = [queryset.query.annotations[name] for name in self.names]
+        self.output_fields = [expression.output_field for expression in resolved]
+        # Only values of non-nullable columns are known not to be NULL.
+        self.nullable = [
+            not isinstance(expression, Col) or expression.output_field.null
+            for expression in resolved
+        ]
+
+        if position is not None:
+            try:
+                position = [
+                    None if value is None else field.to_python(value)
+                    for value, field in zip(position, self.output_fields)
+                ]
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+            directions = [descending != self.reverse for _, descending in keys]
+            queryset = queryset.filter(self.after(position, directions))
+
+        results = list(queryset[: self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[: self.limit]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.first = self.get_position(results[0]) if results else position
+        self.last = self.get_position(results[-1]) if results else position
+        if not results:
+            self.has_next = self.has_next and position is not None
+            self.has_previous = self.has_previous and position is not None
+
+        return results
+
+    def get_keys(self, queryset):
+        """Return ordering expressions and directions of ``queryset``.
+
+        Return ``None`` if the queryset is ordered randomly.
+
+        """
+        query = queryset.query
+        ordering = list(query.order_by)
+        if not ordering and query.default_ordering:
+            ordering = list(query.get_meta().ordering)
+
+        pk_names = {'pk', query.get_meta().pk.name}
+        keys = []
+        unique = False
+        for term in ordering:
+            if isinstance(term, str):
+                if term == '?':
+                    return None
+                descending = term.startswith('-')
+                name = term.lstrip('-')
+                unique = unique or name in pk_names
+                keys.append((F(name), descending))
+            elif isinstance(term, OrderBy):
+                keys.append((term.expression, term.descending))
+            else:
+                keys.append((term, False))
+
+            if unique:
+                # Remaining terms cannot change the order.
+                break
+
+        if not unique:
+            keys.append((F('pk'), False))
+
+        return keys
+
+    def after(self, position, directions):
+        """Return condition selecting rows following ``position``.
+
+        Postgres sorts ``NULL`` values last in ascending and first in
+        descending order.
+
+        """
+        condition = None
+        equal = Q()
+        for name, value, descending, nullable in zip(
+            self.names, position, directions, self.nullable
+        ):
+            if value is None:
+                same = Q(**{name + '__isnull': True})
+                following = ~same if descending else None
+            elif descending:
+                same = Q(**{name: value})
+                following = Q(**{name + '__lt': value})
+            else:
+                same = Q(**{name: value})
+                following = Q(**{name + '__gt': value})
+                if nullable:
+                    following |= Q(**{name + '__isnull': True})
+
+            if following is not None:
+                following = equal & following
+                condition = following if condition is None else condition | following
+            equal &= same
+
+        if condition is None:
+            # Nothing follows the last possible position.
+            return Q(pk__in=[])
+
+        name, value, descending = self.names[0], position[0], directions[0]
+        if value is not None and not (self.nullable[0] and not descending):
+            # Redundant range on the first key lets the database start
+            # an index scan at the position instead of filtering rows.
+            lookup = '{}__{}'.format(name, 'lte' if descending else 'gte')
+            condition &= Q(**{lookup: value})
+
+        return condition
+
+    def get_position(self, instance):
+        """Return key values of ``instance``."""
+        return [getattr(instance, name) for name in self.names]
+
+    def encode_cursor(self, position, reverse):
+        """Return opaque cursor pointing to ``position``."""
+        payload = json.dumps(
+            {'p': position, 'r': reverse}, default=_encode_key_value
+        )
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request, length):
+        """Return position and direction from the cursor in ``request``."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != length:
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def get_cursor_link(self, position, reverse):
+        """Return URL of the page following or preceding ``position``."""
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        url = remove_query_param(url, self.pagination_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position, reverse)
+        )
+
+    def get_next_link(self):
+        """Return URL of the next page."""
+        if not self.keyset:
+            return super().get_next_link()
+
+        if not self.has_next:
+            return None
+        return self.get_cursor_link(self.last, False)
+
+    def get_previous_link(self):
+        """Return URL of the previous page."""
+        if not self.keyset:
+            return super().get_previous_link()
+
+        if not self.has_previous:
+            return None
+        return self.get_cursor_link(self.first, True)
+
+    def get_paginated_response(self, data):
+        """Return paginated response."""
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        return Response(
+            OrderedDict(
+                [
+                    ('next', self.get_next_link()),
+                    ('previous', self.get_previous_link()),
+                    ('results', data),
+                ]
+            )
+        )
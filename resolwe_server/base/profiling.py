@@ -0,0 +1,230 @@
+"""Statistical profiling of slow requests.
+
+While :class:`ProfilingMiddleware` handles a request, a sampler thread
+periodically records the stack of the thread handling it. Samples of
+requests that take longer than the threshold, or that carry a valid
+signed ``X-Profile`` header, are saved as folded stacks, the input format
+of ``flamegraph.pl`` and speedscope. Only the most recent profiles are
+kept on disk.
+
+"""
+from collections import Counter
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+from resolwe.utils import BraceMessage as __
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULTS = {
+    'ENABLED': False,
+    # Requests taking longer than this many seconds are saved.
+    'THRESHOLD': 1.0,
+    # Seconds between samples of the stack.
+    'INTERVAL': 0.005,
+    'DIRECTORY': None,
+    # Number of saved profiles to keep.
+    'MAX_PROFILES': 100,
+}
+
+# Header requesting a profile regardless of the threshold.
+HEADER = 'HTTP_X_PROFILE'
+TOKEN_SALT = 'resolwe_server.base.profiling'
+TOKEN_MAX_AGE = 24 * 3600
+
+PROFILE_SUFFIX = '.folded'
+PROFILE_NAME_RE = re.compile(r'^[\w.-]+\.folded$')
+
+
+def get_setting(name):
+    """Return profiling setting ``name``."""
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+def get_directory():
+    """Return directory of saved profiles."""
+    directory = get_setting('DIRECTORY')
+    if directory is None:
+        directory = os.path.join(settings.FLOW_EXECUTOR['RUNTIME_DIR'], 'profiles')
+    return directory
+
+
+def make_token():
+    """Return signed value of the header requesting a profile."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def check_token(token):
+    """Return whether ``token`` is a valid header value."""
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=TOKEN_MAX_AGE)
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def fold_stack(frame):
+    """Return stack of ``frame`` in folded format, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            '{} ({}:{})'.format(
+                code.co_name, code.co_filename, code.co_firstlineno
+            ).replace(';', ':')
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Thread sampling stacks of registered threads."""
+
+    def __init__(self, interval):
+        """Initialize sampler."""
+        self.interval = interval
+        self.samples = {}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self, thread_id):
+        """Start sampling thread ``thread_id``."""
+        with self.condition:
+            self.samples[thread_id] = Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='request-profiler', daemon=True
+                )
+                self.thread.start()
+            self.condition.notify()
+
+    def stop(self, thread_id):
+        """Stop sampling thread ``thread_id`` and return its samples."""
+        with self.condition:
+            return self.samples.pop(thread_id, Counter())
+
+    def run(self):
+        """Sample stacks of registered threads."""
+        own_id = threading.get_ident()
+        while True:
+            with self.condition:
+                # Sleep while no request is profiled.
+                self.condition.wait_for(lambda: self.samples)
+                thread_ids = list(self.samples)
+
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            stacks = {
+                thread_id: fold_stack(frames[thread_id])
+                for thread_id in thread_ids
+                if thread_id in frames and thread_id != own_id
+            }
+            with self.condition:
+                for thread_id, stack in stacks.items():
+                    if thread_id in self.samples:
+                        self.samples[thread_id][stack] += 1
+
+            time.sleep(self.interval)
+
+
+def save_profile(samples, request, duration):
+    """Save ``samples`` of ``request`` and remove the oldest profiles."""
+    directory = get_directory()
+    os.makedirs(directory, exist_ok=True)
+
+    path = re.sub(r'[^\w-]+', '-', request.path).strip('-')[:80] or 'root'
+    name = '{}-{}-{}-{}ms{}'.format(
+        time.strftime('%Y%m%d%H%M%S'),
+        os.getpid(),
+        path,
+        int(duration * 1000),
+        PROFILE_SUFFIX,
+    )
+    with open(os.path.join(directory, name), 'w') as handle:
+        for stack, count in samples.most_common():
+            handle.write('{} {}\n'.format(stack, count))
+
+    profiles = list_profiles()
+    for profile in profiles[get_setting('MAX_PROFILES') :]:
+        try:
+            os.remove(os.path.join(directory, profile['name']))
+        except FileNotFoundError:
+            pass
+
+    return name
+
+
+def list_profiles():
+    """Return saved profiles, newest first."""
+    directory = get_directory()
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for entry in entries:
+        if not PROFILE_NAME_RE.match(entry.name):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        profiles.append(
+            {'name': entry.name, 'size': stat.st_size, 'created': stat.st_mtime}
+        )
+
+    return sorted(profiles, key=lambda profile: profile['created'], reverse=True)
+
+
+def get_profile_path(name):
+    """Return path of saved profile ``name`` or ``None`` if it does not exist."""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = os.path.join(get_directory(), name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """Profile requests and save profiles of slow ones."""
+
+    def __init__(self, get_response):
+        """Initialize middleware."""
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.threshold = get_setting('THRESHOLD')
+        self.sampler = Sampler(get_setting('INTERVAL'))
+
+    def __call__(self, request):
+        """Handle request."""
+        requested = HEADER in request.META and check_token(request.META[HEADER])
+        if self.threshold is None and not requested:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        self.sampler.start(thread_id)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            samples = self.sampler.stop(thread_id)
+        duration = time.perf_counter() - start
+
+        if samples and (
+            requested or (self.threshold is not None and duration >= self.threshold)
+        ):
+            try:
+                response['X-Profile-Name'] = save_profile(samples, request, duration)
+            except OSError as error:
+                logger.warning(__("Saving request profile failed: {}", error))
+
+        return response
@@ -0,0 +1,55 @@
+"""Redis clients sharing connection pools with the cache.
+
+Connection pools of ``django_redis`` are global to the process and keyed
+by URL, so clients returned by :func:`get_redis` for an instance that
+also serves the cache reuse the connections of the cache instead of
+opening their own. Keys are distributed over several instances by the
+same consistent hashing as the cache uses.
+
+"""
+from django.conf import settings
+
+from django_redis.client import ShardClient
+from django_redis.hash_ring import HashRing
+from django_redis.pool import get_connection_factory
+
+# Exports.
+__all__ = ('get_redis',)
+
+# Hash rings by locations, they are expensive to build.
+_rings = {}  # pylint: disable=invalid-name
+
+
+def _get_factory():
+    """Return connection factory configured like the default cache."""
+    options = settings.CACHES['default'].get('OPTIONS', {})
+    return get_connection_factory(options=options)
+
+
+def _get_location(locations, key):
+    """Return location of ``key`` like :class:`ShardClient` does."""
+    locations = tuple(locations)
+    if locations not in _rings:
+        _rings[locations] = HashRing(locations)
+
+    key = str(key)
+    # Keys with a {hash tag} are placed by the tag only.
+    match = ShardClient._findhash.match(key)  # pylint: disable=protected-access
+    if match is not None:
+        key = match.group(1)
+    return _rings[locations].get_node(key)
+
+
+def get_redis(role='cache', key=None):
+    """Return Redis client for ``role``, see ``REDIS_LOCATIONS`` setting.
+
+    When ``role`` uses several instances, the instance is chosen by
+    ``key``, so that all data of one key is kept on one instance.
+
+    """
+    locations = settings.REDIS_LOCATIONS[role]
+    location = locations[0]
+    if key is not None and len(locations) > 1:
+        location = _get_location(locations, key)
+
+    return _get_factory().connect(location)
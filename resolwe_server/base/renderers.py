@@ -0,0 +1,102 @@
+"""JSON renderers.
+
+:class:`FastJSONRenderer` encodes responses with ``orjson``, which is a
+requirement of the server. When it cannot be installed, e.g. on platforms
+without its wheels, the standard library encoder used by Django REST
+Framework is used instead. Large arrays can be streamed element by element
+with :class:`StreamingJSONResponse` instead of being encoded at once.
+
+"""
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # pylint: disable=invalid-name
+
+# Exports.
+__all__ = ('FastJSONRenderer', 'StreamingJSONResponse', 'encode_json')
+
+# Encoded elements are sent to the client in chunks of about this size.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Line and paragraph separators are valid in JSON, but not in JavaScript.
+_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+_encoder = JSONEncoder(  # pylint: disable=invalid-name
+    ensure_ascii=False, separators=(',', ':')
+)
+
+
+def _default(obj):
+    """Encode objects not supported by ``orjson`` the same way as DRF."""
+    return _encoder.default(obj)
+
+
+def encode_json(data):
+    """Return compact UTF-8 encoded JSON of ``data``."""
+    if orjson is not None:
+        content = orjson.dumps(
+            data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME
+        )
+    else:
+        content = _encoder.encode(data).encode('utf-8')
+
+    for separator, escaped in _SEPARATORS:
+        content = content.replace(separator, escaped)
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Render JSON with a fast encoder.
+
+    Indented output, requested by the client or by the view, is rendered
+    by the default renderer.
+
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render ``data`` into JSON."""
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Match the default renderer, which encodes datetimes, decimals
+        # and lazy strings with the DRF encoder.
+        return encode_json(data)
+
+
+def iter_json_array(elements, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield chunks of a JSON array of ``elements``.
+
+    Elements are encoded one at a time, so the whole array is never held
+    in memory.
+
+    """
+    chunk = bytearray(b'[')
+    separator = b''
+    for element in elements:
+        chunk += separator
+        chunk += encode_json(element)
+        separator = b','
+        if len(chunk) >= chunk_size:
+            yield bytes(chunk)
+            chunk = bytearray()
+
+    chunk += b']'
+    yield bytes(chunk)
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """Response streaming ``elements`` as a JSON array."""
+
+    def __init__(self, elements, *args, **kwargs):
+        """Initialize response."""
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(iter_json_array(elements), *args, **kwargs)
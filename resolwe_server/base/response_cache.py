@@ -0,0 +1,165 @@
+"""Per-user cache of API list responses.
+
+Cached responses are keyed by the view, the user, the query parameters
+and generation counters of the scopes the response depends on, e.g.
+``process`` or ``permissions``. Signal handlers bump the generation of a
+scope when its data changes, so stale responses are never served and
+responses of unrelated scopes stay cached.
+
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from rest_framework import permissions
+from rest_framework.response import Response
+
+from .metrics import record_cache
+
+try:
+    from rest_framework_reactive.request import Request as ObserverRequest
+except ImportError:
+    ObserverRequest = None  # pylint: disable=invalid-name
+
+GENERATION_KEY = 'api-cache:generation:{}'
+RESPONSE_KEY = 'api-cache:response:{}'
+
+DEFAULTS = {
+    'ENABLED': False,
+    'TIMEOUT': 300,
+}
+
+
+def get_setting(name):
+    """Return response cache setting ``name``."""
+    return getattr(settings, 'API_RESPONSE_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def user_scope(user_id):
+    """Return scope of data specific to the user with ``user_id``."""
+    return 'user:{}'.format(user_id)
+
+
+def _initial_generation():
+    """Return a generation that has not been used before.
+
+    Generations of evicted counters must not restart at a value that
+    has already been used, or stale responses would be served again.
+
+    """
+    return int(time.time() * 1000000)
+
+
+def is_observed(request):
+    """Return whether ``request`` is observed by the reactive framework.
+
+    Observers evaluate the view again with their own request, which has
+    the ``observe`` parameter removed.
+
+    """
+    if 'observe' in request.query_params:
+        return True
+
+    return ObserverRequest is not None and isinstance(
+        getattr(request, '_request', None), ObserverRequest
+    )
+
+
+def get_generations(scopes):
+    """Return current generations of ``scopes``."""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _initial_generation(), None)
+            generations[key] = cache.get(key)
+
+    return [generations[key] for key in keys]
+
+
+def _bump(scopes):
+    """Increment generations of ``scopes``."""
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_generation(), None)
+
+
+def bump(*scopes):
+    """Invalidate cached responses depending on ``scopes``."""
+    _bump(scopes)
+    # Responses may be cached from uncommitted data in the meantime.
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+class CachedResponseMixin:
+    """Cache list responses of a viewset per user.
+
+    Set ``cache_scopes`` to the scopes the responses depend on. The scope
+    of the requesting user is always included. Requests observed by the
+    reactive framework are never cached.
+
+    """
+
+    cache_scopes = ()
+
+    def get_response_cache_key(self, request):
+        """Return cache key of the response to ``request``."""
+        user_id = request.user.pk if request.user.is_authenticated else None
+        scopes = list(self.cache_scopes) + [user_scope(user_id)]
+        fingerprint = json.dumps(
+            [
+                type(self).__module__,
+                type(self).__name__,
+                self.action,
+                request.get_host(),
+                request.path,
+                user_id,
+                get_generations(scopes),
+                sorted(request.query_params.lists()),
+            ]
+        )
+        digest = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+        return RESPONSE_KEY.format(digest)
+
+    def list(self, request, *args, **kwargs):
+        """Return cached list response if available."""
+        if (
+            not get_setting('ENABLED')
+            or request.method not in permissions.SAFE_METHODS
+            or is_observed(request)
+        ):
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        record_cache('response', data is not None)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'hit'
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, get_setting('TIMEOUT'))
+        response['X-Cache'] = 'miss'
+        return response
+
+
+def cached_responses(viewset_class, scopes):
+    """Return subclass of ``viewset_class`` caching list responses."""
+    return type(
+        viewset_class.__name__,
+        (CachedResponseMixin, viewset_class),
+        {
+            '__doc__': viewset_class.__doc__,
+            '__module__': viewset_class.__module__,
+            'cache_scopes': tuple(scopes),
+        },
+    )
@@ -0,0 +1,189 @@
+"""Ranked prefix and fuzzy search of users.
+
+Searched fields are indexed by trigram GIN indexes on their upper-cased
+text, the same expression as case-insensitive lookups use, so prefix
+(``LIKE``) and fuzzy (``<%``, word similarity) matches are found in the
+indexes. Fuzzy matching uses the ``pg_trgm.word_similarity_threshold``
+of the database. Results are ranked with prefix matches first and then
+by the best word similarity of any field.
+
+"""
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import (
+    Case,
+    FloatField,
+    Func,
+    IntegerField,
+    Lookup,
+    Q,
+    TextField,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Greatest, Upper
+
+USER_FIELDS = ('username', 'first_name', 'last_name', 'email')
+PROFILE_FIELDS = ('lab', 'company')
+
+# Prefix of names of trigram indexes.
+INDEX_PREFIX = 'user_search_'
+
+# Shorter queries only match prefixes, they have too few trigrams.
+MIN_FUZZY_LENGTH = 3
+
+
+@TextField.register_lookup
+class TrigramWordSimilar(Lookup):
+    """Match values containing a word similar to the given text."""
+
+    lookup_name = 'trigram_word_similar'
+
+    def as_sql(self, compiler, connection):  # pylint: disable=redefined-outer-name
+        """Return SQL of the lookup."""
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '{} <%% {}'.format(rhs, lhs), rhs_params + lhs_params
+
+
+class WordSimilarity(Func):
+    """Greatest similarity of the text to a word of the value."""
+
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+
+def _search_expression(field_name):
+    """Return indexed expression of ``field_name``."""
+    return Upper(Cast(field_name, TextField()))
+
+
+def get_profile_fields():
+    """Return profile model, its user field and searched fields or ``None``."""
+    try:
+        profile_field = get_user_model()._meta.get_field(  # pylint: disable=protected-access
+            'profile'
+        )
+    except FieldDoesNotExist:
+        return None
+
+    profile_model = profile_field.related_model
+    fields = []
+    for name in PROFILE_FIELDS:
+        try:
+            profile_model._meta.get_field(name)  # pylint: disable=protected-access
+        except FieldDoesNotExist:
+            continue
+        fields.append(name)
+
+    return profile_model, profile_field.field.attname, fields
+
+
+def _matching(model, fields, text):
+    """Return queryset of ``model`` objects with ``fields`` matching ``text``."""
+    condition = Q()
+    annotations = {}
+    for name in fields:
+        condition |= Q(**{name + '__istartswith': text})
+        if len(text) >= MIN_FUZZY_LENGTH:
+            alias = '_search_' + name
+            annotations[alias] = _search_expression(name)
+            condition |= Q(**{alias + '__trigram_word_similar': text.upper()})
+
+    return (
+        model._default_manager.annotate(  # pylint: disable=protected-access
+            **annotations
+        ).filter(condition)
+    )
+
+
+def search_users(queryset, text):
+    """Filter users in ``queryset`` by ``text`` and order them by rank."""
+    text = text.strip()
+    if not text:
+        return queryset
+
+    condition = Q(pk__in=_matching(get_user_model(), USER_FIELDS, text).values('pk'))
+    ranked = list(USER_FIELDS)
+
+    profile = get_profile_fields()
+    if profile is not None and profile[2]:
+        profile_model, user_attname, fields = profile
+        # Each table is searched separately, so that both use their indexes.
+        condition |= Q(
+            pk__in=_matching(profile_model, fields, text).values(user_attname)
+        )
+        ranked.extend('profile__' + name for name in fields)
+
+    prefix = Case(
+        *[When(**{name + '__istartswith': text}, then=Value(1)) for name in ranked],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+    similarity = Greatest(
+        *[
+            WordSimilarity(Value(text.upper()), _search_expression(name))
+            for name in ranked
+        ]
+    )
+
+    return (
+        queryset.filter(condition)
+        .annotate(search_prefix=prefix, search_rank=similarity)
+        .order_by('-search_prefix', '-search_rank', 'username')
+    )
+
+
+def _index_name(table, column):
+    """Return name of the trigram index of ``column`` of ``table``."""
+    return '{}{}_{}'.format(INDEX_PREFIX, table, column)[:63]
+
+
+def _indexed_columns():
+    """Yield tables and columns of searched fields."""
+    user_meta = get_user_model()._meta  # pylint: disable=protected-access
+    yield user_meta.db_table, [user_meta.get_field(name).column for name in USER_FIELDS]
+
+    profile = get_profile_fields()
+    if profile is not None:
+        profile_meta = profile[0]._meta  # pylint: disable=protected-access
+        # The profile may be provided by an app migrated later.
+        if profile_meta.db_table in connection.introspection.table_names():
+            yield profile_meta.db_table, [
+                profile_meta.get_field(name).column for name in profile[2]
+            ]
+
+
+def create_indexes():
+    """Create trigram indexes of searched fields.
+
+    The indexes are built concurrently, so this must not run inside a
+    transaction.
+
+    """
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for table, columns in _indexed_columns():
+            for column in columns:
+                cursor.execute(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} '
+                    'USING GIN ((UPPER({}::text)) gin_trgm_ops)'.format(
+                        quote_name(_index_name(table, column)),
+                        quote_name(table),
+                        quote_name(column),
+                    )
+                )
+
+
+def drop_indexes():
+    """Drop trigram indexes of searched fields."""
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for table, columns in _indexed_columns():
+            for column in columns:
+                cursor.execute(
+                    'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(
+                        quote_name(_index_name(table, column))
+                    )
+                )
@@ -0,0 +1,173 @@
+"""Signal handlers."""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from rest_framework.authtoken.models import Token
+
+from resolwe.flow.models import Data, DescriptorSchema, Process
+
+from . import authentication, memoization, response_cache, visibility
+
+
+@receiver(pre_save, sender=Data)
+def memoize_new_data(sender, instance, raw=False, **kwargs):
+    """Serve new Data objects from cache before they are dispatched."""
+    # pylint: disable=protected-access
+    if raw or not instance._state.adding:
+        return
+
+    if memoization.is_memoizable(instance):
+        memoization.lookup(instance)
+
+
+@receiver(post_save, sender=Data)
+def memoize_data(sender, instance, created=False, **kwargs):
+    """Link files of new Data objects served from cache and store finished ones."""
+    if created:
+        memoization.created(instance)
+    elif instance.status in (
+        Data.STATUS_DONE,
+        Data.STATUS_ERROR,
+    ) and memoization.is_memoizable(instance):
+        memoization.store(instance)
+
+
+@receiver(post_delete, sender=Data)
+def evict_memoized_data(sender, instance, **kwargs):
+    """Evict cache entries pointing to deleted Data objects."""
+    if memoization.get_setting('ENABLED'):
+        memoization.evict(instance.pk)
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def invalidate_visible_users(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate cached visibility of users affected by membership changes."""
+    if action == 'pre_clear':
+        # Memberships are gone after the clear, so remember them now.
+        related = instance.user_set if reverse else instance.groups
+        instance._cleared_ids = set(  # pylint: disable=protected-access
+            related.values_list('pk', flat=True)
+        )
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_ids', set())
+
+    if reverse:
+        group_ids, user_ids = {instance.pk}, pk_set
+    else:
+        group_ids, user_ids = pk_set, {instance.pk}
+
+    visibility.invalidate(group_ids=group_ids, user_ids=user_ids)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_members(sender, instance, **kwargs):
+    """Remember members of a group before it is deleted."""
+    instance._deleted_user_ids = set(  # pylint: disable=protected-access
+        instance.user_set.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_group_members(sender, instance, **kwargs):
+    """Invalidate cached visibility of members of a deleted group."""
+    visibility.invalidate(user_ids=getattr(instance, '_deleted_user_ids', ()))
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def invalidate_membership_responses(sender, action, **kwargs):
+    """Invalidate cached responses depending on group membership."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        response_cache.bump('membership')
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_responses(sender, instance, **kwargs):
+    """Invalidate cached responses depending on a user."""
+    response_cache.bump('user', response_cache.user_scope(instance.pk))
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Remove a changed user from the authentication cache."""
+    authentication.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """Remove a changed token from the authentication cache."""
+    authentication.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_responses(sender, instance, **kwargs):
+    """Invalidate cached responses depending on groups."""
+    response_cache.bump('group', 'membership')
+
+
+@receiver(post_save, sender=Process)
+@receiver(post_delete, sender=Process)
+def invalidate_process_responses(sender, instance, **kwargs):
+    """Invalidate cached responses depending on processes."""
+    response_cache.bump('process')
+
+
+@receiver(post_save, sender=DescriptorSchema)
+@receiver(post_delete, sender=DescriptorSchema)
+def invalidate_descriptor_schema_responses(sender, instance, **kwargs):
+    """Invalidate cached responses depending on descriptor schemas."""
+    response_cache.bump('descriptorschema')
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+def invalidate_user_permission_responses(sender, instance, **kwargs):
+    """Invalidate cached responses depending on permissions of a user."""
+    if instance.user.username == settings.ANONYMOUS_USER_NAME:
+        # Public permissions apply to everyone.
+        response_cache.bump('permissions')
+    else:
+        response_cache.bump(response_cache.user_scope(instance.user_id))
+
+
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+def invalidate_group_permission_responses(sender, instance, **kwargs):
+    """Invalidate cached responses depending on permissions of groups."""
+    response_cache.bump('permissions')
+
+
+def invalidate_profile_responses(sender, instance, **kwargs):
+    """Invalidate cached responses depending on user profiles."""
+    response_cache.bump('profile')
+
+
+try:
+    profile_model = get_user_model()._meta.get_field(  # pylint: disable=invalid-name,protected-access
+        'profile'
+    ).related_model
+except FieldDoesNotExist:
+    pass
+else:
+    post_save.connect(invalidate_profile_responses, sender=profile_model)
+    post_delete.connect(invalidate_profile_responses, sender=profile_model)
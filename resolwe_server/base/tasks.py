@@ -0,0 +1,117 @@
+"""Celery tasks.
+
+Emails are sent over an SMTP connection kept open by each worker process,
+so consecutive tasks do not pay for connecting and authenticating. Failed
+deliveries are retried with exponential backoff.
+
+"""
+import logging
+import smtplib
+
+from celery import shared_task
+
+from django.contrib.auth import get_user_model
+from django.core.mail import get_connection
+
+from resolwe.utils import BraceMessage as __
+
+from . import accounts
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Maximum number of delivery attempts after the first one.
+MAX_RETRIES = 5
+
+# Delay before the first retry in seconds, doubled on each retry.
+RETRY_DELAY = 30
+
+# Maximum number of messages sent in a single batch.
+BATCH_SIZE = 100
+
+_connection = None  # pylint: disable=invalid-name
+
+
+def _get_connection():
+    """Return open connection to the mail server of this worker."""
+    global _connection  # pylint: disable=global-statement,invalid-name
+    if _connection is None:
+        _connection = get_connection(fail_silently=False)
+    # Opening an already open connection does nothing.
+    _connection.open()
+    return _connection
+
+
+def _close_connection():
+    """Close connection to the mail server of this worker."""
+    global _connection  # pylint: disable=global-statement,invalid-name
+    if _connection is not None:
+        try:
+            _connection.close()
+        except (smtplib.SMTPException, OSError):
+            pass
+        _connection = None
+
+
+def _deliver(task, messages):
+    """Send ``messages`` over the pooled connection, retrying ``task`` on failure."""
+    try:
+        _get_connection().send_messages(messages)
+    except (smtplib.SMTPException, OSError) as error:
+        # The server may have dropped the connection.
+        _close_connection()
+        logger.warning(
+            __(
+                "Sending {} email(s) failed (attempt {}): {}",
+                len(messages),
+                task.request.retries + 1,
+                error,
+            )
+        )
+        raise task.retry(
+            exc=error,
+            countdown=RETRY_DELAY * 2 ** task.request.retries,
+            max_retries=MAX_RETRIES,
+        )
+
+
+def _get_users(user_ids):
+    """Return existing users with ``user_ids`` that have an email address."""
+    users = get_user_model().objects.filter(pk__in=user_ids).exclude(email='')
+    found = {user.pk: user for user in users}
+    for user_id in set(user_ids) - set(found):
+        logger.warning(__("Not sending email to user {} without an address.", user_id))
+    return [found[user_id] for user_id in user_ids if user_id in found]
+
+
+@shared_task(bind=True, rate_limit='60/m')
+def send_reset_email(self, user_id, community=None):
+    """Send password reset email to user ``user_id``."""
+    users = _get_users([user_id])
+    if users:
+        _deliver(self, [accounts.build_reset_email(users[0], community=community)])
+
+
+@shared_task(bind=True, rate_limit='60/m')
+def send_activation_email(self, user_id):
+    """Send account activation email to user ``user_id``."""
+    users = _get_users([user_id])
+    if users:
+        _deliver(self, [accounts.build_activation_email(users[0])])
+
+
+@shared_task(bind=True, rate_limit='6/m')
+def send_activation_emails(self, user_ids):
+    """Send account activation emails to users ``user_ids`` in batches.
+
+    Larger lists are split into tasks of at most ``BATCH_SIZE`` users, so
+    a failed batch does not resend emails of other batches.
+
+    """
+    if len(user_ids) > BATCH_SIZE:
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            send_activation_emails.delay(user_ids[start : start + BATCH_SIZE])
+        return
+
+    messages = [accounts.build_activation_email(user) for user in _get_users(user_ids)]
+    if messages:
+        _deliver(self, messages)
@@ -7,4 +7,6 @@ from . import views
 urlpatterns = [  # pylint: disable=invalid-name
     path('csrf', views.csrf_view),
     path('auth', views.authorization, name='authorization'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('profiles', views.profiles_view, name='profiles'),
 ]
@@ -1,3 +1,5 @@
 "“”General viwes.“”"
 from .csrf import *
+from .metrics import *
+from .profiling import *
 from .user import *
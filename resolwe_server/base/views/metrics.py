@@ -0,0 +1,31 @@
+"""Metrics endpoint."""
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .. import metrics
+
+# Exports.
+__all__ = ('metrics_view',)
+
+
+def metrics_view(request):
+    """Return request metrics in the Prometheus text format.
+
+    Available to staff users and to scrapers sending the configured
+    bearer token.
+
+    """
+    token = metrics.get_setting('TOKEN')
+    authorized = request.user.is_staff or (
+        token
+        and constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer {}'.format(token)
+        )
+    )
+    if not authorized:
+        return HttpResponse(status=403)
+
+    metrics.flush(force=True)
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
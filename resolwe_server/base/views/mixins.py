@@ -0,0 +1,176 @@
+"""View mixins."""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+
+from rest_framework import permissions
+
+# Exports.
+__all__ = ('SparseFieldsetsMixin', 'sparse_fieldsets')
+
+
+class SparseFieldsetsMixin:
+    """Restrict serialized fields on request.
+
+    The ``fields`` query parameter lists the fields to include and the
+    ``exclude`` query parameter the fields to leave out, both separated
+    by commas, e.g. ``?fields=id,name``. Subfield projections such as
+    ``output__x`` keep the top-level field ``output`` and are left to the
+    projection of the serializer. Model fields that are not needed by any
+    remaining serializer field are deferred, and related objects that are
+    not needed are neither joined nor prefetched. Nothing is deferred when
+    a remaining field reads the whole instance or an attribute that is
+    not a model field, as it may need any of them.
+
+    """
+
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def _get_param_values(self, param):
+        """Return set of comma-separated values of query parameter ``param``."""
+        values = set()
+        for value in self.request.query_params.getlist(param):
+            values.update(name.strip() for name in value.split(',') if name.strip())
+        return values
+
+    def _get_included_fields(self):
+        """Return names of requested top-level fields."""
+        return {
+            name.split('__')[0]
+            for name in self._get_param_values(self.fields_query_param)
+        }
+
+    def _get_excluded_fields(self):
+        """Return names of excluded top-level fields."""
+        # Excluding subfields is not supported, such values are ignored.
+        return {
+            name
+            for name in self._get_param_values(self.exclude_query_param)
+            if '__' not in name
+        }
+
+    def get_dropped_fields(self, fields):
+        """Return names of serializer ``fields`` that were not requested."""
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return set()
+
+        include = self._get_included_fields()
+        exclude = self._get_excluded_fields()
+
+        dropped = {name for name in fields if name in exclude}
+        if include:
+            dropped.update(name for name in fields if name not in include)
+        return dropped
+
+    def get_serializer(self, *args, **kwargs):
+        """Return serializer with only the requested fields."""
+        serializer = super().get_serializer(*args, **kwargs)
+
+        fields = getattr(serializer, 'child', serializer).fields
+        for name in self.get_dropped_fields(fields):
+            fields.pop(name)
+
+        return serializer
+
+    def filter_queryset(self, queryset):
+        """Return queryset loading only what the requested fields need."""
+        queryset = super().filter_queryset(queryset)
+
+        query_params = self.request.query_params
+        if not (
+            self.fields_query_param in query_params
+            or self.exclude_query_param in query_params
+        ):
+            return queryset
+
+        serializer_class = self.get_serializer_class()
+        fields = serializer_class(context=self.get_serializer_context()).fields
+        dropped = self.get_dropped_fields(fields)
+        if not dropped:
+            return queryset
+
+        def source_root(field):
+            """Return the attribute of the instance used by ``field``."""
+            return field.source.split('.')[0]
+
+        model_meta = queryset.model._meta  # pylint: disable=protected-access
+        attributes = set()
+        for model_field in model_meta.get_fields():
+            if model_field.concrete:
+                attributes.update((model_field.name, model_field.attname))
+            elif hasattr(model_field, 'get_accessor_name'):
+                # Reverse relations are accessed by their accessor names.
+                attributes.add(model_field.get_accessor_name())
+            else:
+                attributes.add(model_field.name)
+
+        used = {
+            source_root(field) for name, field in fields.items() if name not in dropped
+        }
+        if not used <= attributes:
+            # Remaining fields read the whole instance or other attributes.
+            return queryset
+
+        unused = {source_root(fields[name]) for name in dropped} - used - {'*'}
+        if not unused:
+            return queryset
+
+        deferred = []
+        for name in unused:
+            try:
+                model_field = model_meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not (
+                model_field.is_relation or model_field.primary_key
+            ):
+                deferred.append(model_field.name)
+        if deferred:
+            queryset = queryset.defer(*deferred)
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict) and unused.intersection(select_related):
+            queryset = queryset.select_related(None)
+            lookups = self._flatten_select_related(
+                {
+                    key: value
+                    for key, value in select_related.items()
+                    if key not in unused
+                }
+            )
+            if lookups:
+                queryset = queryset.select_related(*lookups)
+
+        prefetch_lookups = (
+            queryset._prefetch_related_lookups  # pylint: disable=protected-access
+        )
+        kept_lookups = []
+        for lookup in prefetch_lookups:
+            through = lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+            if through.split('__')[0] not in unused:
+                kept_lookups.append(lookup)
+        if len(kept_lookups) != len(prefetch_lookups):
+            queryset = queryset.prefetch_related(None).prefetch_related(*kept_lookups)
+
+        return queryset
+
+    def _flatten_select_related(self, tree, prefix=''):
+        """Return lookups of a nested ``select_related`` dictionary."""
+        lookups = []
+        for key, subtree in tree.items():
+            lookup = prefix + key
+            if subtree:
+                lookups.extend(self._flatten_select_related(subtree, lookup + '__'))
+            else:
+                lookups.append(lookup)
+        return lookups
+
+
+def sparse_fieldsets(viewset_class):
+    """Return subclass of ``viewset_class`` supporting sparse fieldsets."""
+    return type(
+        viewset_class.__name__,
+        (SparseFieldsetsMixin, viewset_class),
+        {'__doc__': viewset_class.__doc__, '__module__': viewset_class.__module__},
+    )
@@ -0,0 +1,32 @@
+"""Request profiles endpoint."""
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+
+from .. import profiling
+
+# Exports.
+__all__ = ('profiles_view',)
+
+
+def profiles_view(request):
+    """List and download saved request profiles.
+
+    ``GET`` lists saved profiles, newest first, or returns the folded
+    stacks of the profile given by the ``name`` query parameter. ``POST``
+    returns a value of the ``X-Profile`` header, which requests a profile
+    of any request for a day. Only staff users have access.
+
+    """
+    if not request.user.is_staff:
+        return HttpResponse(status=403)
+
+    if request.method == 'POST':
+        return JsonResponse({'header': 'X-Profile', 'value': profiling.make_token()})
+
+    name = request.GET.get('name')
+    if name is None:
+        return JsonResponse({'profiles': profiling.list_profiles()})
+
+    path = profiling.get_profile_path(name)
+    if path is None:
+        raise Http404()
+    return FileResponse(open(path, 'rb'), content_type='text/plain; charset=utf-8')
@@ -1,9 +1,17 @@
 """User configuration."""
+import multiprocessing
+import os
 import re
+import threading
 
 from django.contrib.auth import get_user_model, update_session_auth_hash
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AnonymousUser, Group
-from django.db.models import Q
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import router, transaction
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
@@ -15,7 +23,12 @@ from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from django_filters.rest_framework.backends import DjangoFilterBackend
 
+from .. import authentication, response_cache
+from ..accounts import activate_account, reset_password, send_reset_email
 from ..filters import GroupFilter, UserFilter
+from ..response_cache import CachedResponseMixin
+from ..visibility import visible_users
+from .mixins import SparseFieldsetsMixin
 
 # Exports.
 __all__ = ('authorization', 'UserViewSet', 'GroupViewSet')
@@ -77,6 +90,18 @@ class GroupSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'users')
 
 
+class GroupMemberCountSerializer(serializers.ModelSerializer):
+    """Serializer for :class:`Group` objects with member counts."""
+
+    user_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        """Serializer configuration."""
+
+        model = Group
+        fields = ('id', 'name', 'user_count')
+
+
 class ChangePasswordSerializer(
     serializers.Serializer
 ):  # pylint: disable=abstract-method
@@ -110,7 +135,26 @@ class PasswordResetSerializer(
     password = serializers.CharField()
 
 
+class BulkUserSerializer(serializers.Serializer):  # pylint: disable=abstract-method
+    """Serializer for a single record of bulk user provisioning."""
+
+    username = serializers.CharField(max_length=150)
+    first_name = serializers.CharField(max_length=30, allow_blank=True, required=False)
+    last_name = serializers.CharField(max_length=150, allow_blank=True, required=False)
+    email = serializers.EmailField(allow_blank=True, required=False)
+    password = serializers.CharField(required=False)
+    groups = serializers.ListField(child=serializers.IntegerField(), required=False)
+    profile = serializers.DictField(required=False)
+
+    def validate_username(self, value):
+        """Validate username with the validator of the user model."""
+        get_user_model().username_validator(value)
+        return value
+
+
 class UserViewSet(
+    SparseFieldsetsMixin,
+    CachedResponseMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.UpdateModelMixin,
@@ -122,6 +166,7 @@ class UserViewSet(
     permission_classes = (IsStaffOrTargetUser,)
     filter_backends = (DjangoFilterBackend, OrderingFilter)
     filter_class = UserFilter
+    cache_scopes = ('user', 'membership', 'profile')
 
     def get_queryset(self):
         """Return query sets."""
@@ -138,16 +183,37 @@ class UserViewSet(
         if user.is_superuser:
             return user_model.objects.all().select_related('profile')
         elif user.is_authenticated:
-            return (
-                user_model.objects.filter(
-                    Q(groups__in=user.groups.all()) | Q(pk=user.pk)
-                )
-                .distinct('id')
-                .select_related('profile')
-            )
+            return visible_users(user).select_related('profile')
         else:
             return user_model.objects.none()
 
+    @list_route(methods=['post'])
+    def bulk(self, request):
+        """Create or update many users at once.
+
+        Expects a list of user records under ``users``. Records of existing
+        usernames are only applied if ``update`` is set. Respond with the
+        outcome for each record: ``created``, ``updated``, ``exists``,
+        ``duplicate`` or ``invalid``.
+
+        """
+        # Records may set passwords of any account and group memberships.
+        if not request.user.is_superuser:
+            return Response(
+                {'error': "Only superusers can provision users."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        records = request.data.get('users')
+        if not isinstance(records, list):
+            return Response(
+                {'error': "Malformed bulk user request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = provision_users(records, update=bool(request.data.get('update')))
+        return Response({'results': results})
+
     @list_route(methods=['post'])
     def request_password_reset(self, request):
         """Request user password reset."""
@@ -164,8 +230,8 @@ class UserViewSet(
                     {'error': "User does not exist."}, status=status.HTTP_404_NOT_FOUND
                 )
 
-            send_reset_email(
-                user, community=serializer.data.get('community', None))
+            # The email is sent by a Celery worker.
+            send_reset_email(user, community=serializer.data.get('community', None))
             return Response({})
         else:
             return Response(
@@ -234,6 +300,8 @@ class UserViewSet(
 
 
 class GroupViewSet(
+    SparseFieldsetsMixin,
+    CachedResponseMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.UpdateModelMixin,
@@ -245,43 +313,469 @@ class GroupViewSet(
     permission_classes = (IsSuperuserOrReadOnly,)
     filter_backends = (DjangoFilterBackend, OrderingFilter)
     filter_class = GroupFilter
+    cache_scopes = ('group', 'membership')
+
+    def get_members_mode(self):
+        """Return how members are listed: ``list`` or ``count``.
+
+        Members of groups in the list are given by primary keys unless
+        ``members=count`` is requested. Use the ``members`` endpoint to
+        paginate members of large groups.
+
+        """
+        if self.request.query_params.get('members') == 'count':
+            return 'count'
+        return 'list'
+
+    def get_serializer_class(self):
+        """Return serializer class."""
+        if self.action == 'list' and self.get_members_mode() == 'count':
+            return GroupMemberCountSerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
         """Return query sets."""
         user = self.request.user
 
         if user.is_superuser:
-            return Group.objects.all()
+            queryset = Group.objects.all()
         elif user.is_authenticated:
-            return user.groups.all()
+            queryset = user.groups.all()
         else:
             return Group.objects.none()
 
+        if self.action != 'list':
+            return queryset
+        elif self.get_members_mode() == 'count':
+            # Counted in a subquery, the membership join of the queryset of
+            # non-superusers would restrict the count to themselves.
+            user_counts = (
+                _membership_model()
+                .objects.filter(group_id=OuterRef('pk'))
+                .order_by()
+                .values('group_id')
+                .annotate(count=Count('*'))
+                .values('count')
+            )
+            return queryset.annotate(
+                user_count=Coalesce(
+                    Subquery(user_counts, output_field=IntegerField()), 0
+                )
+            )
+        else:
+            return queryset.prefetch_related(
+                Prefetch('user_set', queryset=get_user_model().objects.only('id'))
+            )
+
+    @detail_route(methods=['get'])
+    def members(self, request, pk=None):
+        """Endpoint for listing paginated primary keys of group members."""
+        group = self.get_object()
+
+        users = group.user_set.only('id').order_by('pk')
+        page = self.paginate_queryset(users)
+        if page is None:
+            return Response([user.pk for user in users])
+
+        return self.get_paginated_response([user.pk for user in page])
+
     @detail_route(methods=['post'])
     def add_users(self, request, pk=None):
-        """Endpoint for adding users to group."""
+        """Endpoint for adding users to group.
+
+        Respond with the outcome for each given user: ``added``,
+        ``already_member`` or ``not_found``.
+
+        """
         group = self.get_object()
 
         users = request.data.get('user_ids')
         if not isinstance(users, list):
             users = [users]
+        invalid = _invalid_user_ids_response(users)
+        if invalid is not None:
+            return invalid
 
-        group.user_set.add(*users)
-
-        return Response()
+        return Response({'results': add_group_users(group, users)})
 
     @detail_route(methods=['post'])
     def remove_users(self, request, pk=None):
-        """Endpoint for removing users from group."""
+        """Endpoint for removing users from group.
+
+        Respond with the outcome for each given user: ``removed``,
+        ``not_member`` or ``not_found``.
+
+        """
         group = self.get_object()
 
         users = request.data.get('user_ids')
         if not isinstance(users, list):
             users = [users]
+        invalid = _invalid_user_ids_response(users)
+        if invalid is not None:
+            return invalid
+
+        return Response({'results': remove_group_users(group, users)})
+
+
+def _membership_model():
+    """Return the through model of user-group memberships."""
+    return get_user_model().groups.through
+
+
+def parse_user_id(value):
+    """Return user identifier given as ``value`` or ``None`` if invalid.
+
+    Only integers and strings of digits are accepted, booleans and floats
+    are not silently converted.
+
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and re.fullmatch('[0-9]+', value):
+        return int(value)
+    return None
+
+
+def _invalid_user_ids_response(users):
+    """Return error response if any of ``users`` is invalid, else ``None``."""
+    invalid = [user for user in users if parse_user_id(user) is None]
+    if not invalid:
+        return None
+
+    return Response(
+        {'error': "Invalid user identifiers.", 'user_ids': invalid},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def _resolve_user_ids(group, users):
+    """Validate user identifiers in a single query.
 
-        group.user_set.remove(*users)
+    Return a list of ``(user, user_id)`` pairs, where ``user_id`` is
+    ``None`` for invalid identifiers, the set of existing users and the
+    set of members of ``group`` among them.
 
-        return Response()
+    """
+    resolved = [(user, parse_user_id(user)) for user in users]
+
+    user_ids = {user_id for _, user_id in resolved if user_id is not None}
+    existing = set(
+        get_user_model()
+        .objects.filter(pk__in=user_ids)
+        .values_list('pk', flat=True)
+    )
+    members = set(
+        _membership_model()
+        .objects.filter(group_id=group.pk, user_id__in=existing)
+        .values_list('user_id', flat=True)
+    )
+
+    return resolved, existing, members
+
+
+def _send_membership_signal(group, action, user_ids):
+    """Send ``m2m_changed`` signal as ``group.user_set`` would."""
+    m2m_changed.send(
+        sender=_membership_model(),
+        instance=group,
+        action=action,
+        reverse=True,
+        model=get_user_model(),
+        pk_set=user_ids,
+        using=router.db_for_write(_membership_model(), instance=group),
+    )
+
+
+def add_group_users(group, users, batch_size=1000):
+    """Add ``users`` to ``group`` with a bulk insert.
+
+    Return a list of per-user outcomes.
+
+    """
+    resolved, existing, members = _resolve_user_ids(group, users)
+    added = existing - members
+
+    if added:
+        with transaction.atomic():
+            _send_membership_signal(group, 'pre_add', added)
+            _membership_model().objects.bulk_create(
+                [
+                    _membership_model()(group_id=group.pk, user_id=user_id)
+                    for user_id in sorted(added)
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            _send_membership_signal(group, 'post_add', added)
+
+    results = []
+    for user, user_id in resolved:
+        if user_id is None:
+            outcome = 'invalid'
+        elif user_id not in existing:
+            outcome = 'not_found'
+        elif user_id in members:
+            outcome = 'already_member'
+        else:
+            outcome = 'added'
+        results.append({'id': user, 'status': outcome})
+
+    return results
+
+
+def remove_group_users(group, users):
+    """Remove ``users`` from ``group`` with a bulk delete.
+
+    Return a list of per-user outcomes.
+
+    """
+    resolved, existing, members = _resolve_user_ids(group, users)
+
+    if members:
+        with transaction.atomic():
+            _send_membership_signal(group, 'pre_remove', members)
+            _membership_model().objects.filter(
+                group_id=group.pk, user_id__in=members
+            ).delete()
+            _send_membership_signal(group, 'post_remove', members)
+
+    results = []
+    for user, user_id in resolved:
+        if user_id is None:
+            outcome = 'invalid'
+        elif user_id not in existing:
+            outcome = 'not_found'
+        elif user_id in members:
+            outcome = 'removed'
+        else:
+            outcome = 'not_member'
+        results.append({'id': user, 'status': outcome})
+
+    return results
+
+
+# Passwords of larger batches are hashed in a pool of processes.
+HASH_POOL_THRESHOLD = 16
+HASH_POOL_SIZE = min(4, os.cpu_count() or 1)
+
+_hash_pool = None  # pylint: disable=invalid-name
+_hash_pool_lock = threading.Lock()  # pylint: disable=invalid-name
+
+
+def _get_hash_pool():
+    """Return the process pool hashing passwords, shared by all requests."""
+    global _hash_pool  # pylint: disable=global-statement,invalid-name
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # Workers are not forked from the server, whose other threads
+            # may hold locks, e.g. of logging handlers, while it forks.
+            context = multiprocessing.get_context('forkserver')
+            _hash_pool = context.Pool(processes=HASH_POOL_SIZE)
+        return _hash_pool
+
+
+def hash_passwords(passwords):
+    """Return hashes of ``passwords``, ``None`` giving unusable passwords."""
+    if len(passwords) < HASH_POOL_THRESHOLD or HASH_POOL_SIZE < 2:
+        return [make_password(password) for password in passwords]
+
+    # Hashing is CPU bound and slow by design, so spread it across cores.
+    return _get_hash_pool().map(make_password, passwords, chunksize=4)
+
+
+def _profile_model():
+    """Return the profile model of users or ``None``."""
+    try:
+        return (
+            get_user_model()
+            ._meta.get_field('profile')  # pylint: disable=protected-access
+            .related_model
+        )
+    except FieldDoesNotExist:
+        return None
+
+
+def _validate_profile(profile_model, profile):
+    """Return cleaned ``profile`` values of ``profile_model`` and errors."""
+    if profile_model is None:
+        return None, ["Users have no profiles."]
+
+    fields = {
+        field.name: field
+        for field in profile_model._meta.concrete_fields  # pylint: disable=protected-access
+        if not (field.primary_key or field.is_relation)
+    }
+    unknown = sorted(set(profile) - set(fields))
+    if unknown:
+        return None, ["Unknown profile fields: {}.".format(', '.join(unknown))]
+
+    values = {}
+    errors = []
+    for name, value in profile.items():
+        try:
+            values[name] = fields[name].clean(value, None)
+        except ValidationError as error:
+            errors.extend('{}: {}'.format(name, message) for message in error.messages)
+    return values, errors
+
+
+def provision_users(records, update=False, batch_size=1000):
+    """Create or update users of ``records`` with bulk queries.
+
+    All records are validated first, checking existing usernames and
+    groups with a single query each. Users, their profiles and group
+    memberships are then written in one transaction. Return a list of
+    per-record outcomes.
+
+    """
+    user_model = get_user_model()
+    profile_model = _profile_model()
+
+    results = []
+    valid = []
+    for record in records:
+        serializer = BulkUserSerializer(data=record)
+        username = record.get('username') if isinstance(record, dict) else None
+        result = {'username': username}
+        results.append(result)
+
+        if not serializer.is_valid():
+            result.update(status='invalid', errors=serializer.errors)
+            continue
+
+        data = serializer.validated_data
+        if 'profile' in data:
+            data['profile'], errors = _validate_profile(profile_model, data['profile'])
+            if errors:
+                result.update(status='invalid', errors={'profile': errors})
+                continue
+
+        valid.append((result, data))
+
+    usernames = {data['username'] for _, data in valid}
+    existing = {
+        user.username: user
+        for user in user_model.objects.filter(username__in=usernames)
+    }
+    group_ids = {group_id for _, data in valid for group_id in data.get('groups', [])}
+    groups = Group.objects.in_bulk(group_ids)
+
+    seen = set()
+    to_create = []
+    to_update = []
+    for result, data in valid:
+        username = data['username']
+        missing_groups = sorted(set(data.get('groups', [])) - set(groups))
+        if username in seen:
+            result['status'] = 'duplicate'
+        elif missing_groups:
+            result.update(
+                status='invalid',
+                errors={'groups': ["Unknown groups: {}.".format(missing_groups)]},
+            )
+        elif username in existing and not update:
+            result.update(status='exists', id=existing[username].pk)
+        elif username in existing:
+            to_update.append((result, data, existing[username]))
+        else:
+            to_create.append((result, data, user_model(username=username)))
+        seen.add(username)
+
+    if not (to_create or to_update):
+        return results
+
+    user_fields = ('first_name', 'last_name', 'email')
+    updated_fields = set()
+    for _, data, user in to_create + to_update:
+        for field in user_fields:
+            if field in data:
+                setattr(user, field, data[field])
+                updated_fields.add(field)
+
+    # New users without a password get an unusable one.
+    hashed = []
+    for _, data, user in to_create + to_update:
+        if 'password' in data or user.pk is None:
+            hashed.append((user, data.get('password')))
+    for (user, _), password in zip(
+        hashed, hash_passwords([password for _, password in hashed])
+    ):
+        if user.pk is not None:
+            updated_fields.add('password')
+        user.password = password
+
+    with transaction.atomic():
+        user_model.objects.bulk_create(
+            [user for _, _, user in to_create], batch_size=batch_size
+        )
+        if to_update and updated_fields:
+            user_model.objects.bulk_update(
+                [user for _, _, user in to_update],
+                sorted(updated_fields),
+                batch_size=batch_size,
+            )
+
+        if profile_model is not None:
+            _provision_profiles(profile_model, to_create, to_update, batch_size)
+
+        members = {}
+        for _, data, user in to_create + to_update:
+            for group_id in data.get('groups', []):
+                members.setdefault(group_id, []).append(user.pk)
+        for group_id, user_ids in members.items():
+            add_group_users(groups[group_id], user_ids, batch_size=batch_size)
+
+        # Bulk queries do not send the signals that invalidate responses
+        # and cached users of sessions and tokens.
+        response_cache.bump('user', 'profile')
+
+    for _, _, user in to_update:
+        authentication.invalidate_user(user.pk)
+
+    for result, _, user in to_create:
+        result.update(status='created', id=user.pk)
+    for result, _, user in to_update:
+        result.update(status='updated', id=user.pk)
+
+    return results
+
+
+def _provision_profiles(profile_model, to_create, to_update, batch_size):
+    """Create missing profiles and apply given profile values."""
+    profile_field = get_user_model()._meta.get_field(  # pylint: disable=protected-access
+        'profile'
+    )
+    user_field = profile_field.field.name
+    users = [user for _, _, user in to_create + to_update]
+    profiles = {
+        getattr(profile, profile_field.field.attname): profile
+        for profile in profile_model.objects.filter(
+            **{'{}__in'.format(user_field): users}
+        )
+    }
+
+    new_profiles = []
+    changed_profiles = []
+    changed_fields = set()
+    for _, data, user in to_create + to_update:
+        values = data.get('profile', {})
+        profile = profiles.get(user.pk)
+        if profile is None:
+            new_profiles.append(profile_model(**{user_field: user}, **values))
+            continue
+
+        for name, value in values.items():
+            setattr(profile, name, value)
+        if values:
+            changed_profiles.append(profile)
+            changed_fields.update(values)
+
+    profile_model.objects.bulk_create(new_profiles, batch_size=batch_size)
+    if changed_profiles:
+        profile_model.objects.bulk_update(
+            changed_profiles, sorted(changed_fields), batch_size=batch_size
+        )
 
 
 @csrf_exempt  # TODO: add token to request
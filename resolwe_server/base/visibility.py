@@ -0,0 +1,89 @@
+"""Users visible to other users.
+
+Authenticated users can see themselves and all members of their groups.
+Identifiers of visible users are cached per user and invalidated when
+group membership changes.
+
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .metrics import record_cache
+
+VISIBLE_USERS_KEY = 'visible-users:{}'
+
+# Cache timeout in seconds.
+TIMEOUT = 3600
+
+# Visibility of users with more co-members is checked in the database.
+MAX_CACHED_USERS = 10000
+
+
+def _memberships():
+    """Return queryset of user-group memberships."""
+    return get_user_model().groups.through.objects.all()
+
+
+def get_visible_user_ids(user):
+    """Return identifiers of users visible to ``user`` or ``None``.
+
+    ``None`` is returned when there are too many visible users to cache.
+
+    """
+    key = VISIBLE_USERS_KEY.format(user.pk)
+    user_ids = cache.get(key)
+    record_cache('visibility', user_ids is not None)
+    if user_ids is not None:
+        return user_ids or None
+
+    user_groups = _memberships().filter(user_id=user.pk).values('group_id')
+    user_ids = set(
+        _memberships()
+        .filter(group_id__in=user_groups)
+        .values_list('user_id', flat=True)
+        .distinct()[: MAX_CACHED_USERS + 1]
+    )
+    user_ids.add(user.pk)
+
+    if len(user_ids) > MAX_CACHED_USERS:
+        # Remember that the set is too large.
+        cache.set(key, set(), TIMEOUT)
+        return None
+
+    cache.set(key, user_ids, TIMEOUT)
+    return user_ids
+
+
+def visible_users(user):
+    """Return queryset of users visible to ``user``."""
+    user_model = get_user_model()
+    user_ids = get_visible_user_ids(user)
+    if user_ids is not None:
+        return user_model.objects.filter(pk__in=user_ids)
+
+    user_groups = _memberships().filter(user_id=user.pk).values('group_id')
+    co_membership = _memberships().filter(
+        user_id=OuterRef('pk'), group_id__in=user_groups
+    )
+    return (
+        user_model.objects.annotate(is_co_member=Exists(co_membership))
+        .filter(Q(is_co_member=True) | Q(pk=user.pk))
+    )
+
+
+def invalidate(group_ids=(), user_ids=()):
+    """Invalidate cached visibility of members of groups and given users."""
+    affected = set(user_ids)
+    if group_ids:
+        affected.update(
+            _memberships()
+            .filter(group_id__in=group_ids)
+            .values_list('user_id', flat=True)
+        )
+
+    keys = [VISIBLE_USERS_KEY.format(user_id) for user_id in affected]
+    cache.delete_many(keys)
+    # Entries may be repopulated from uncommitted data in the meantime.
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -11,6 +11,16 @@ from django.conf import settings
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "resolwe_server.settings")
 
+# Queues of processes by scheduling class, see the priority workload
+# connector. Workers consuming only the interactive queue reserve capacity
+# for interactive processes.
+QUEUE_INTERACTIVE = 'interactive'
+QUEUE_BATCH = 'batch'
+
+# Message priorities of the Redis transport, where 0 is the highest.
+PRIORITY_HIGHEST = 0
+PRIORITY_LOWEST = 9
+
 app = None
 if Celery:
     app = Celery('resolwe_server')
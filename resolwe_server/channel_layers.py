@@ -0,0 +1,194 @@
+"""Channel layers.
+
+:class:`InstrumentedRedisChannelLayer` extends the Redis channel layer
+with per-channel metrics and backpressure. Every message is stamped with
+the time it was sent, so receivers can measure how long it waited in the
+channel. Counters are kept in memory and periodically added to Redis
+hashes, where the ``channel_depths`` management command reads them.
+
+Senders to a channel that is filling up are slowed down gradually, so
+consumers can catch up before the channel is full and messages are lost
+with ``ChannelFull`` errors.
+
+"""
+import asyncio
+from collections import defaultdict
+import time
+
+from channels_redis.core import RedisChannelLayer
+
+# Exports.
+__all__ = ('InstrumentedRedisChannelLayer',)
+
+# Key of the time a message was sent.
+ENQUEUED_AT_KEY = '__enqueued_at__'
+
+
+class InstrumentedRedisChannelLayer(RedisChannelLayer):
+    """Redis channel layer recording metrics and applying backpressure.
+
+    Besides the options of ``RedisChannelLayer``, it accepts:
+
+    ``backpressure_threshold``
+        fill ratio of a channel above which senders are delayed
+    ``max_backpressure_delay``
+        delay in seconds of sends to a channel at capacity
+    ``depth_check_interval``
+        minimal number of seconds between checks of a channel's depth
+    ``metrics_interval``
+        number of seconds between writes of metrics to Redis
+
+    """
+
+    def __init__(
+        self,
+        *args,
+        backpressure_threshold=0.5,
+        max_backpressure_delay=1.0,
+        depth_check_interval=0.5,
+        metrics_interval=10,
+        **kwargs
+    ):
+        """Initialize metrics."""
+        super().__init__(*args, **kwargs)
+        self.backpressure_threshold = backpressure_threshold
+        self.max_backpressure_delay = max_backpressure_delay
+        self.depth_check_interval = depth_check_interval
+        self.metrics_interval = metrics_interval
+
+        self.depths = {}
+        self.metrics = defaultdict(lambda: defaultdict(int))
+        self.metrics_flushed = time.monotonic()
+
+    def metrics_key(self, channel=None):
+        """Return Redis key of metrics of ``channel`` or of the channel set."""
+        if channel is None:
+            return '{}metrics:channels'.format(self.prefix)
+        return '{}metrics:channel:{}'.format(self.prefix, channel)
+
+    def metric_name(self, channel):
+        """Return name under which metrics of ``channel`` are recorded.
+
+        Process-specific channels of a client are recorded together.
+
+        """
+        if '!' in channel:
+            return self.non_local_name(channel)
+        return channel
+
+    def channel_key(self, channel):
+        """Return Redis key of the list of messages in ``channel``."""
+        if '!' in channel:
+            channel = self.non_local_name(channel)
+        return self.prefix + channel
+
+    async def channel_depth(self, channel):
+        """Return number of messages waiting in ``channel``.
+
+        General channels are spread over all hosts.
+
+        """
+        depth = 0
+        for index in range(self.ring_size):
+            async with self.connection(index) as connection:
+                depth += await connection.llen(self.channel_key(channel))
+        return depth
+
+    async def apply_backpressure(self, channel):
+        """Delay sending to ``channel`` if it is filling up."""
+        now = time.monotonic()
+        name = self.metric_name(channel)
+        checked_at, depth = self.depths.get(name, (None, 0))
+        if checked_at is None or now - checked_at > self.depth_check_interval:
+            depth = await self.channel_depth(channel)
+            self.depths[name] = (now, depth)
+
+        fill = depth / self.get_capacity(channel)
+        if fill <= self.backpressure_threshold:
+            return
+
+        delay = self.max_backpressure_delay * min(
+            (fill - self.backpressure_threshold) / (1 - self.backpressure_threshold),
+            1,
+        )
+        metrics = self.metrics[name]
+        metrics['delayed'] += 1
+        metrics['delay_ms'] += int(delay * 1000)
+        await asyncio.sleep(delay)
+
+    async def send(self, channel, message):
+        """Send ``message`` to ``channel``."""
+        await self.apply_backpressure(channel)
+
+        message = dict(message)
+        message[ENQUEUED_AT_KEY] = time.time()
+        try:
+            await super().send(channel, message)
+        except Exception:
+            self.metrics[self.metric_name(channel)]['failed'] += 1
+            raise
+
+        self.metrics[self.metric_name(channel)]['enqueued'] += 1
+        await self.maybe_flush_metrics()
+
+    async def group_send(self, group, message):
+        """Send ``message`` to all channels of ``group``."""
+        message = dict(message)
+        message[ENQUEUED_AT_KEY] = time.time()
+        await super().group_send(group, message)
+
+        # Groups of individual sessions are recorded together.
+        self.metrics['group:{}'.format(group.rsplit('.', 1)[0])]['enqueued'] += 1
+        await self.maybe_flush_metrics()
+
+    async def receive(self, channel):
+        """Receive a message from ``channel``."""
+        message = await super().receive(channel)
+
+        metrics = self.metrics[self.metric_name(channel)]
+        metrics['dequeued'] += 1
+        enqueued_at = message.pop(ENQUEUED_AT_KEY, None)
+        if enqueued_at is not None:
+            latency = max(int((time.time() - enqueued_at) * 1000), 0)
+            metrics['latency_ms'] += latency
+            metrics['latency_count'] += 1
+            metrics['latency_max_ms'] = max(metrics['latency_max_ms'], latency)
+
+        await self.maybe_flush_metrics()
+        return message
+
+    async def maybe_flush_metrics(self):
+        """Add recorded metrics to Redis if the interval has passed."""
+        if time.monotonic() - self.metrics_flushed < self.metrics_interval:
+            return
+
+        metrics, self.metrics = self.metrics, defaultdict(lambda: defaultdict(int))
+        self.metrics_flushed = time.monotonic()
+        try:
+            async with self.connection(0) as connection:
+                for channel, values in metrics.items():
+                    key = self.metrics_key(channel)
+                    await connection.sadd(self.metrics_key(), channel)
+                    for name, value in values.items():
+                        if name == 'latency_max_ms':
+                            # Only the maximum of the last interval is kept.
+                            await connection.hset(key, name, value)
+                        else:
+                            await connection.hincrby(key, name, value)
+                    await connection.expire(key, int(self.expiry))
+                await connection.expire(self.metrics_key(), int(self.expiry))
+        except Exception:  # pylint: disable=broad-except
+            # Metrics must never break messaging.
+            pass
+
+    async def get_metrics(self):
+        """Return metrics recorded by all processes, by channel."""
+        async with self.connection(0) as connection:
+            channels = await connection.smembers(self.metrics_key(), encoding='utf-8')
+            metrics = {}
+            for channel in channels:
+                values = await connection.hgetall(
+                    self.metrics_key(channel), encoding='utf-8'
+                )
+                metrics[channel] = {name: int(value) for name, value in values.items()}
+        return metrics
@@ -0,0 +1,207 @@
+"""Logging handlers, filters and formatters.
+
+Records are put on an in-memory queue by :class:`QueueHandler` and written
+by a background listener thread, so logging never blocks the thread that
+handles a request on a slow stream. Noisy messages are limited by
+:class:`RateLimitFilter` before they are queued.
+
+"""
+from collections import OrderedDict
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# Exports.
+__all__ = ('JsonFormatter', 'QueueHandler', 'RateLimitFilter')
+
+# Attributes of every log record, which are not extra fields.
+RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord('', 0, '', 0, '', (), None).__dict__
+) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON objects, one per line.
+
+    Extra fields given to the logging call are included.
+
+    """
+
+    def format(self, record):
+        """Format ``record``."""
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for name, value in record.__dict__.items():
+            if name not in RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Limit the rate of each message of the given loggers.
+
+    At most ``rate`` records with the same message template are passed
+    per ``period`` seconds. The number of suppressed records is added to
+    the next passed one as the ``suppressed`` attribute.
+
+    """
+
+    # Maximum number of tracked message templates.
+    max_keys = 1000
+
+    def __init__(self, rate=10, period=60, loggers=()):
+        """Initialize filter."""
+        super().__init__()
+        self.rate = rate
+        self.period = period
+        self.loggers = tuple(loggers)
+        self.windows = OrderedDict()
+        self.lock = threading.Lock()
+
+    def applies_to(self, name):
+        """Return whether records of logger ``name`` are limited."""
+        return any(
+            name == logger or name.startswith(logger + '.') for logger in self.loggers
+        )
+
+    def filter(self, record):
+        """Return whether ``record`` is passed."""
+        if not self.applies_to(record.name):
+            return True
+
+        template = getattr(record.msg, 'fmt', record.msg)
+        key = (record.name, record.levelno, str(template))
+        now = time.monotonic()
+        with self.lock:
+            start, count, suppressed = self.windows.pop(key, (now, 0, 0))
+            if now - start >= self.period:
+                start, count = now, 0
+
+            passed = count < self.rate
+            if passed:
+                if suppressed:
+                    record.suppressed = suppressed
+                self.windows[key] = (start, count + 1, 0)
+            else:
+                self.windows[key] = (start, count, suppressed + 1)
+
+            while len(self.windows) > self.max_keys:
+                self.windows.popitem(last=False)
+
+        return passed
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Hand records to a listener thread writing them to a stream.
+
+    The handler owns the :class:`~logging.StreamHandler` the listener
+    writes to, which uses the formatter configured for this handler. When
+    the queue holds ``maxsize`` records, new records are dropped instead
+    of blocking, and the number of dropped records is logged later.
+
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        """Initialize handler."""
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.listener = None
+        self.listener_pid = None
+        self.listener_lock = threading.Lock()
+        self.dropped = 0
+
+    def start_listener(self):
+        """Start listener thread of this process if it is not running."""
+        if self.listener_pid == os.getpid():
+            return
+
+        with self.listener_lock:
+            if self.listener_pid == os.getpid():
+                return
+
+            # Listener threads are not inherited by forked processes.
+            self.queue = queue.Queue(self.queue.maxsize)
+            self.listener = logging.handlers.QueueListener(self.queue, self.target)
+            self.listener.start()
+            self.listener_pid = os.getpid()
+
+    def setFormatter(self, fmt):  # pylint: disable=invalid-name
+        """Set formatter of the records written by the listener."""
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """Prepare ``record`` for the listener thread.
+
+        Unlike the default, leave formatting to the target handler.
+
+        """
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        """Put ``record`` on the queue without blocking."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            try:
+                self.queue.put_nowait(
+                    logging.makeLogRecord(
+                        {
+                            'name': __name__,
+                            'levelno': logging.WARNING,
+                            'levelname': 'WARNING',
+                            'msg': "Dropped {} log records.".format(dropped),
+                        }
+                    )
+                )
+            except queue.Full:
+                self.dropped += dropped
+
+    def emit(self, record):
+        """Queue ``record``."""
+        try:
+            self.start_listener()
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+            return
+        super().emit(record)
+
+    def close(self):
+        """Write queued records and stop the listener."""
+        with self.listener_lock:
+            if self.listener is not None and self.listener_pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self.listener_pid = None
+        self.target.close()
+        super().close()
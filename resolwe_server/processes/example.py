@@ -1,3 +1,7 @@
+import json
+import multiprocessing
+import os
+
 from resolwe.process import *
 
 
@@ -5,7 +9,7 @@ class WordCountBasic(Process):
     name = 'Word Count'
     slug = 'wc-basic'
     process_type = 'data:wc'
-    version = '1.0.0'
+    version = '1.1.0'
 
     class Input:
         doc = FileField('Document')
@@ -14,8 +18,13 @@ class WordCountBasic(Process):
         words = IntegerField('Number of words')
 
     def run(self, inputs, outputs):
-        with open(inputs.doc.file_temp) as fp:
-            words = len(fp.read().split())
+        # Use counts computed by the uploader if available.
+        try:
+            with open(inputs.doc.file_temp + '.analysis') as fp:
+                words = json.load(fp)['counts']['words']
+        except (IOError, ValueError, KeyError, TypeError):
+            with open(inputs.doc.file_temp) as fp:
+                words = len(fp.read().split())
 
         outputs.words = words
 
@@ -68,3 +77,72 @@ class LineCount(Process):
     def run(self, inputs, outputs):
         with open(inputs.doc.dst.path) as fp:
             outputs.lines = len(fp.readlines())
+
+
+def _document_stats(path):
+    with open(path) as fp:
+        lines = words = 0
+        for line in fp:
+            lines += 1
+            words += len(line.split())
+
+    return lines, words
+
+
+class DocumentStatsBatch(Process):
+    """Count lines and words of many documents in a single job.
+
+    Documents are processed by a pool of workers, so the overhead of
+    creating and dispatching a job is paid only once per batch.
+
+    """
+
+    name = 'Document statistics (batch)'
+    slug = 'doc-stats-batch'
+    process_type = 'data:stat:batch'
+    version = '1.1.0'
+    requirements = {'resources': {'cores': 4}}
+
+    class Input:
+        docs = ListField(DataField('doc'), label='Documents')
+        per_document = BooleanField(
+            label='Store per-document results', default=False
+        )
+
+    class Output:
+        table = FileField(label='Table of line and word counts')
+        documents = IntegerField(label='Number of documents')
+        lines = IntegerField(label='Total number of lines')
+        words = IntegerField(label='Total number of words')
+        per_document = JsonField(label='Per-document results', required=False)
+
+    def run(self, inputs, outputs):
+        ids = [doc.id for doc in inputs.docs]
+        paths = [doc.dst.path for doc in inputs.docs]
+
+        workers = min(os.cpu_count() or 1, self.requirements['resources']['cores'])
+        with multiprocessing.Pool(workers) as pool:
+            stats = pool.map(_document_stats, paths, chunksize=16)
+
+        # Documents of different Data objects may have the same name.
+        results = [
+            {
+                'id': data_id,
+                'document': os.path.basename(path),
+                'lines': lines,
+                'words': words,
+            }
+            for data_id, path, (lines, words) in zip(ids, paths, stats)
+        ]
+
+        with open('stats.tsv', 'w') as fp:
+            fp.write('id\tdocument\tlines\twords\n')
+            for result in results:
+                fp.write('{id}\t{document}\t{lines}\t{words}\n'.format(**result))
+
+        outputs.table = 'stats.tsv'
+        outputs.documents = len(results)
+        outputs.lines = sum(result['lines'] for result in results)
+        outputs.words = sum(result['words'] for result in results)
+        if inputs.per_document:
+            outputs.per_document = {'documents': results}
@@ -1,27 +1,30 @@
 """Routing configuration for Django Channels."""
 from django.urls import path
 
+from channels.auth import AuthMiddlewareStack
 from channels.routing import ChannelNameRouter, ProtocolTypeRouter, URLRouter
 
 from resolwe.flow.consumers import PurgeConsumer
 from resolwe.flow.managers.consumer import ManagerConsumer
 from resolwe.flow.managers.state import MANAGER_CONTROL_CHANNEL
 from resolwe.flow.protocol import CHANNEL_PURGE_WORKER
-from rest_framework_reactive.consumers import (
-    ClientConsumer,
-    MainConsumer,
-    WorkerConsumer,
-)
+from rest_framework_reactive.consumers import MainConsumer, WorkerConsumer
 from rest_framework_reactive.protocol import CHANNEL_MAIN, CHANNEL_WORKER
 
+from resolwe_server.base.consumers import CoalescingClientConsumer
+from resolwe_server.uploader.consumers import DataFilesConsumer
+
 application = ProtocolTypeRouter(
     {  # pylint: disable=invalid-name
         # Client-facing consumers.
         'websocket': URLRouter(
             [
-                # To change the prefix, you can import ClientConsumer in your custom
-                # Channels routing definitions instead of using these defaults.
-                path('ws/<slug:subscriber_id>', ClientConsumer)
+                # Observer updates are coalesced and rate limited per subscriber.
+                path('ws/<slug:subscriber_id>', CoalescingClientConsumer),
+                # Files of a Data object and their changes.
+                path(
+                    'ws/files/<int:data_id>', AuthMiddlewareStack(DataFilesConsumer)
+                ),
             ]
         ),
         # Background worker consumers.
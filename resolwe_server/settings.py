@@ -16,6 +16,17 @@ SECRET_KEY = 'set-this-in-production'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Deployment profile: 'development' or 'production'.
+DEPLOYMENT_PROFILE = os.environ.get('RESOLWE_DEPLOYMENT_PROFILE', 'development')
+
+# Role of this node: 'full' serves everything, 'api' the REST API and its
+# websockets, 'download' data downloads and 'upload' file uploads. Nodes
+# with a narrower role install fewer apps and start faster.
+DEPLOYMENT_ROLES = ('full', 'api', 'download', 'upload')
+DEPLOYMENT_ROLE = os.environ.get('RESOLWE_DEPLOYMENT_ROLE', 'full')
+if DEPLOYMENT_ROLE not in DEPLOYMENT_ROLES:
+    raise ValueError("Unknown deployment role: '{}'.".format(DEPLOYMENT_ROLE))
+
 ALLOWED_HOSTS = ['*']
 
 # Application definition
@@ -27,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'rest_framework_reactive',
@@ -45,7 +57,28 @@ INSTALLED_APPS = [
     'resolwe_server.uploader',
 ]
 
+# Roles needing the given apps, all roles need the others.
+ROLE_APPS = {
+    'django.contrib.admin': ('full',),
+    'django.contrib.messages': ('full',),
+    'django.contrib.staticfiles': ('full', 'api'),
+    'rest_framework_reactive': ('full', 'api'),
+    'rest_auth': ('full', 'api'),
+    'corsheaders': ('full', 'api'),
+    'channels': ('full', 'api'),
+    'resolwe.elastic': ('full', 'api'),
+    'resolwe.toolkit': ('full',),
+}
+INSTALLED_APPS = [
+    app
+    for app in INSTALLED_APPS
+    if DEPLOYMENT_ROLE in ROLE_APPS.get(app, DEPLOYMENT_ROLES)
+]
+
 MIDDLEWARE = [
+    # First, to measure the whole request handling.
+    'resolwe_server.base.metrics.MetricsMiddleware',
+    'resolwe_server.base.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # 'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +89,18 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
 ]
 
+# Roles needing the given middleware, all roles need the others.
+ROLE_MIDDLEWARE = {
+    'django.middleware.csrf.CsrfViewMiddleware': ('full', 'api', 'upload'),
+    'django.contrib.messages.middleware.MessageMiddleware': ('full',),
+    'django.middleware.clickjacking.XFrameOptionsMiddleware': ('full', 'api'),
+}
+MIDDLEWARE = [
+    middleware
+    for middleware in MIDDLEWARE
+    if DEPLOYMENT_ROLE in ROLE_MIDDLEWARE.get(middleware, DEPLOYMENT_ROLES)
+]
+
 ROOT_URLCONF = 'resolwe_server.urls'
 
 TEMPLATES = [
@@ -131,7 +176,8 @@ DATABASES = {
 }
 
 AUTHENTICATION_BACKENDS = (
-    'django.contrib.auth.backends.ModelBackend',
+    # Loads users of sessions from the cache.
+    'resolwe_server.base.authentication.CachedModelBackend',
     'guardian.backends.ObjectPermissionBackend',
 )
 
@@ -140,11 +186,52 @@ ANONYMOUS_USER_NAME = 'AnonymousUser'
 # Redis
 
 REDIS_CONNECTION = {
-    'host': 'localhost',
+    'host': os.environ.get('RESOLWE_REDIS_HOST', 'localhost'),
     'port': int(os.environ.get('RESOLWE_REDIS_PORT', 56379)),
     'db': int(os.environ.get('RESOLWE_REDIS_DATABASE', 1)),
 }
 
+
+def redis_connections(role):
+    """Return connections of the Redis instances used for ``role``.
+
+    Instances are given in the ``RESOLWE_REDIS_<ROLE>`` environment
+    variable as a comma-separated list of ``host:port/db`` entries, where
+    the port and database default to those of ``REDIS_CONNECTION``. All
+    roles use ``REDIS_CONNECTION`` if the variable is not set.
+
+    """
+    value = os.environ.get('RESOLWE_REDIS_{}'.format(role.upper()), '')
+    connections = []
+    for entry in filter(None, (entry.strip() for entry in value.split(','))):
+        address, _, db = entry.partition('/')
+        host, _, port = address.partition(':')
+        connections.append(
+            {
+                'host': host or REDIS_CONNECTION['host'],
+                'port': int(port or REDIS_CONNECTION['port']),
+                'db': int(db or REDIS_CONNECTION['db']),
+            }
+        )
+
+    return connections or [REDIS_CONNECTION]
+
+
+def redis_url(connection):
+    """Return URL of a Redis ``connection``."""
+    return 'redis://{host}:{port}/{db}'.format(**connection)
+
+
+# Redis instances by role. The cache and the channel layer are sharded by
+# consistent hashing when given several instances. The executor and the
+# manager communicate through the same instance, so 'flow' must be one.
+REDIS_LOCATIONS = {
+    'cache': [redis_url(connection) for connection in redis_connections('cache')],
+    'broker': [redis_url(redis_connections('broker')[0])],
+    'channels': [redis_url(connection) for connection in redis_connections('channels')],
+    'flow': [redis_url(redis_connections('flow')[0])],
+}
+
 # Resolwe
 
 FLOW_EXECUTOR = {
@@ -153,21 +240,45 @@ FLOW_EXECUTOR = {
     'UPLOAD_DIR': os.path.join(PROJECT_ROOT, 'data', 'upload'),
     'RUNTIME_DIR': os.path.join(PROJECT_ROOT, 'data', 'runtime'),
     'CONTAINER_IMAGE': 'resolwe/base:ubuntu-18.04',
-    'REDIS_CONNECTION': REDIS_CONNECTION,
+    'REDIS_CONNECTION': redis_connections('flow')[0],
 }
 
 manager_prefix = 'resolwe-server.manager'
 
 FLOW_MANAGER = {
     'REDIS_PREFIX': manager_prefix,
-    'REDIS_CONNECTION': REDIS_CONNECTION,
+    'REDIS_CONNECTION': redis_connections('flow')[0],
     'TEST': {'REDIS_PREFIX': manager_prefix + '-test'},
     'DISPATCHER_MAPPING': {
-        'Interactive': 'resolwe.flow.managers.workload_connectors.celery',
-        'Batch': 'resolwe.flow.managers.workload_connectors.celery',
+        'Interactive': 'resolwe_server.workload_connectors.priority',
+        'Batch': 'resolwe_server.workload_connectors.priority',
     },
 }
 
+# Run executors of lightweight processes in a local pool of warm workers,
+# e.g. on development and CI machines. Programs of the processes are started
+# by the FLOW_EXECUTOR as usual. Other processes use the fallback connector.
+FLOW_LOCAL_POOL = {
+    'PROCESSES': ['upload-doc', 'wc-basic', 'wc', 'ln'],
+    'WORKERS': int(os.environ.get('RESOLWE_LOCAL_POOL_WORKERS', 4)),
+    'FALLBACK': 'resolwe_server.workload_connectors.priority',
+}
+
+if strtobool(os.environ.get('RESOLWE_LOCAL_POOL', 'false')):
+    FLOW_MANAGER['DISPATCHER_MAPPING'] = {
+        'Interactive': 'resolwe_server.workload_connectors.local_pool',
+        'Batch': 'resolwe_server.workload_connectors.local_pool',
+    }
+
+# Celery priorities of processes, where 0 is the highest, see the priority
+# workload connector.
+FLOW_PRIORITY = {
+    'INTERACTIVE': 0,
+    'BATCH': 5,
+    'PROCESSES': {},
+    'FAIR_SHARE_LIMIT': 20,
+}
+
 # Don't pull Docker images up front
 FLOW_DOCKER_DONT_PULL = True
 
@@ -207,33 +318,159 @@ FLOW_DOCKER_VOLUME_EXTRA_OPTIONS = {
 
 FLOW_DOCKER_EXTRA_VOLUMES = []
 
+# Stream processors that analyse uploaded files while they are written.
+# Their results are stored next to the upload in a '.analysis' file.
+UPLOAD_STREAM_PROCESSORS = [
+    'resolwe_server.uploader.analysis.LineWordCount',
+    'resolwe_server.uploader.analysis.FormatSniffer',
+    'resolwe_server.uploader.analysis.GzipValidator',
+    'resolwe_server.uploader.analysis.Sha256Digest',
+]
+
+# Serve results of deterministic processes from cache when their inputs
+# match an earlier successful run. Add the tag configured in BYPASS_TAG
+# to a Data object to force a rerun.
+MEMOIZATION = {
+    'ENABLED': strtobool(os.environ.get('RESOLWE_MEMOIZATION', 'false')),
+    'PROCESSES': ['wc-basic', 'wc', 'ln', 'doc-stats-batch'],
+    'TIMEOUT': 7 * 24 * 3600,
+    'BYPASS_TAG': 'memoization:bypass',
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
+        'resolwe_server.base.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.backends.DjangoFilterBackend',
         'rest_framework.filters.OrderingFilter',
         'resolwe_server.base.filters.JsonOrderingFilter',
+        'resolwe_server.base.filters.JsonFilter',
         'resolwe.permissions.filters.ResolwePermissionsFilter',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'resolwe_server.base.pagination.KeysetPagination',
+    'DEFAULT_RENDERER_CLASSES': (
+        'resolwe_server.base.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'EXCEPTION_HANDLER': 'resolwe.flow.utils.exceptions.resolwe_exception_handler',
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 
-BROKER_URL = 'redis://{host}:{port}/{db}'.format(**REDIS_CONNECTION)
+# Count JSON paths used in ordering, see the json_indexes command.
+JSON_PATH_STATS = True
+
+# Cache list responses of the user, group, process and descriptor schema
+# endpoints per user. Model and permission changes invalidate them.
+API_RESPONSE_CACHE = {
+    'ENABLED': strtobool(os.environ.get('RESOLWE_API_RESPONSE_CACHE', 'true')),
+    'TIMEOUT': 300,
+}
+
+BROKER_URL = REDIS_LOCATIONS['broker'][0]
+
+# Per-route request metrics, served at /api/base/metrics to staff users
+# and to scrapers sending the bearer token.
+METRICS = {
+    'ENABLED': strtobool(os.environ.get('RESOLWE_METRICS', 'false')),
+    'SAMPLE_RATE': float(os.environ.get('RESOLWE_METRICS_SAMPLE_RATE', 1.0)),
+    'FLUSH_INTERVAL': 10,
+    'TOKEN': os.environ.get('RESOLWE_METRICS_TOKEN'),
+}
+
+# Sampling profiler saving folded stacks of slow requests and of requests
+# with a signed X-Profile header, listed at /api/base/profiles.
+PROFILING = {
+    'ENABLED': strtobool(os.environ.get('RESOLWE_PROFILING', 'false')),
+    'THRESHOLD': float(os.environ.get('RESOLWE_PROFILING_THRESHOLD', 1.0)),
+    'INTERVAL': 0.005,
+    'DIRECTORY': os.path.join(PROJECT_ROOT, 'data', 'profiles'),
+    'MAX_PROFILES': 100,
+}
+
+# Coalescing of observer updates sent to websocket subscribers.
+REACTIVE_COALESCING = {
+    'DEBOUNCE': 0.5,
+    'MAX_WAIT': 2.0,
+    'RATE': 20,
+    'BURST': 100,
+}
+
+# Emulate message priorities with a Redis list per priority and take one
+# message at a time, so that priorities are respected.
+BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
+}
+CELERYD_PREFETCH_MULTIPLIER = 1
+
+# Emails are sent by Celery workers from the ordinary queue.
+CELERY_ROUTES = {
+    'resolwe_server.base.tasks.*': {'queue': 'ordinary'},
+}
 
 WS4REDIS_CONNECTION = REDIS_CONNECTION
 
+# Email
+
+EMAIL_HOST = os.environ.get('RESOLWE_EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('RESOLWE_EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('RESOLWE_EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('RESOLWE_EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = strtobool(os.environ.get('RESOLWE_EMAIL_USE_TLS', 'false'))
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.environ.get('RESOLWE_EMAIL_FROM', 'noreply@localhost')
+
+ACCOUNT_EMAILS = {
+    'RESET_URL': os.environ.get(
+        'RESOLWE_RESET_URL', 'http://localhost:3000/reset-password/{token}'
+    ),
+    'ACTIVATION_URL': os.environ.get(
+        'RESOLWE_ACTIVATION_URL', 'http://localhost:3000/activate/{token}'
+    ),
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': 'redis://{host}:{port}/{db}'.format(**REDIS_CONNECTION),
-        'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+        'LOCATION': REDIS_LOCATIONS['cache'],
+        'OPTIONS': {
+            # Keys are distributed over several instances by consistent hashing.
+            'CLIENT_CLASS': (
+                'django_redis.client.ShardClient'
+                if len(REDIS_LOCATIONS['cache']) > 1
+                else 'django_redis.client.DefaultClient'
+            ),
+            # Requests wait for a free connection when all are in use,
+            # instead of failing with "Too many connections".
+            'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
+            'CONNECTION_POOL_KWARGS': {
+                'max_connections': int(
+                    os.environ.get('RESOLWE_REDIS_MAX_CONNECTIONS', 50)
+                ),
+                'timeout': int(os.environ.get('RESOLWE_REDIS_POOL_TIMEOUT', 20)),
+            },
+        },
     }
 }
 
+# Files of Data objects watched by websocket clients, see the
+# watch_data_files command. Uses inotify if inotify_simple is installed.
+DATA_FILES_WATCHER = {
+    'BACKEND': os.environ.get('RESOLWE_FILES_WATCHER_BACKEND', 'auto'),
+    'POLL_INTERVAL': 1.0,
+    'DEBOUNCE': 0.5,
+    'HEARTBEAT': 30,
+}
+
+# Sessions are read from the cache and written through to the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Users of sessions and tokens are cached in the process and in the cache.
+# Changes are published to all processes over Redis.
+AUTH_CACHE = {'LOCAL_TIMEOUT': 10, 'TIMEOUT': 300}
+
 ELASTICSEARCH_HOST = os.environ.get('RESOLWE_ES_HOST', 'localhost')
 ELASTICSEARCH_PORT = int(os.environ.get('RESOLWE_ES_PORT', '59200'))
 
@@ -243,14 +480,20 @@ manager_channels_re = re.compile(r'^{}.*'.format(FLOW_MANAGER['REDIS_PREFIX']))
 
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': 'resolwe_server.channel_layers.InstrumentedRedisChannelLayer',
         'CONFIG': {
-            'hosts': [(REDIS_CONNECTION['host'], REDIS_CONNECTION['port'])],
+            # Process-specific channels and groups are distributed over
+            # several instances by consistent hashing.
+            'hosts': REDIS_LOCATIONS['channels'],
             'expiry': 3600,
             'channel_capacity': {
                 # Make sure no 'communicate' call is dropped.
                 manager_channels_re: 10000
             },
+            # Slow down senders to channels more than half full, see the
+            # channel_depths command.
+            'backpressure_threshold': 0.5,
+            'max_backpressure_delay': 1.0,
         },
     }
 }
@@ -272,10 +515,14 @@ TEST_PROCESS_PROFILE = False
 
 # Logging
 
-# In tests, log warning-level messages to the console, otherwise log info-level messages.
-console_handler_level = (
-    'WARNING' if 'test' in sys.argv else 'INFO'
-)  # pylint: disable=invalid-name
+# Records are written by a listener thread, so that logging does not block
+# requests. Outside development, records are logged as JSON objects.
+if 'test' in sys.argv:
+    LOG_LEVEL = 'WARNING'
+else:
+    LOG_LEVEL = os.environ.get(
+        'RESOLWE_LOG_LEVEL', 'DEBUG' if DEPLOYMENT_PROFILE == 'development' else 'INFO'
+    )
 
 LOGGING = {
     'version': 1,
@@ -283,23 +530,38 @@ LOGGING = {
     'formatters': {
         'standard': {
             'format': '%(asctime)s - %(levelname)s - %(name)s[%(process)s]: %(message)s'
+        },
+        'json': {'()': 'resolwe_server.logs.JsonFormatter'},
+    },
+    'filters': {
+        # Limit messages logged on every request or upload.
+        'rate_limit': {
+            '()': 'resolwe_server.logs.RateLimitFilter',
+            'rate': 10,
+            'period': 60,
+            'loggers': [
+                'django.request',
+                'resolwe_server.base.metrics',
+                'resolwe_server.channel_layers',
+                'resolwe_server.uploader',
+            ],
         }
     },
     'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'level': console_handler_level,
-            'formatter': 'standard',
-        }
+        'queue': {
+            'class': 'resolwe_server.logs.QueueHandler',
+            'formatter': 'standard' if DEPLOYMENT_PROFILE == 'development' else 'json',
+            'filters': ['rate_limit'],
+        },
     },
     'loggers': {
-        '': {'handlers': ['console'], 'level': 'DEBUG'},
-        'raven': {'level': 'WARNING', 'handlers': ['console'], 'propagate': False},
+        '': {'handlers': ['queue'], 'level': LOG_LEVEL},
+        'raven': {'level': 'WARNING', 'handlers': ['queue'], 'propagate': False},
         'elasticsearch': {
-            'handlers': ['console'],
+            'handlers': ['queue'],
             'level': 'WARNING',
             'propagate': False,
         },
-        'urllib3': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'urllib3': {'handlers': ['queue'], 'level': 'WARNING', 'propagate': False},
     },
 }
@@ -0,0 +1,337 @@
+"""Ingest-time analysis of uploaded files.
+
+Stream processors see every chunk of an upload as it is written to disk
+and compute cheap statistics along the way. Their results are stored
+next to the completed upload in a ``.analysis`` JSON file, so processes
+can use them instead of reading the whole file again.
+
+Uploads are analysed in the worker process that receives their chunks.
+When a chunk arrives out of order or at a different worker, the rest of
+the file is analysed from disk once the upload is complete.
+
+"""
+from collections import OrderedDict
+import codecs
+import hashlib
+import json
+import threading
+import zlib
+
+# Maximum number of uploads analysed at the same time by one process.
+MAX_PIPELINES = 256
+
+# Size of blocks read from disk when catching up with the upload.
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Maximum size of a single block of decompressed data.
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+
+
+def analysis_path(filetemp):
+    """Return path of the analysis results of upload ``filetemp``."""
+    return filetemp + '.analysis'
+
+
+def load_analysis(filetemp):
+    """Return analysis results of upload ``filetemp`` or ``None``."""
+    try:
+        with open(analysis_path(filetemp)) as handle:
+            return json.load(handle)
+    except (IOError, ValueError):
+        return None
+
+
+class StreamProcessor:
+    """Base class for stream processors.
+
+    Subclasses set ``name``, under which their result is stored, and
+    implement :meth:`update` and :meth:`result`.
+
+    """
+
+    name = None
+
+    def update(self, chunk):
+        """Process the next ``chunk`` of the upload."""
+        raise NotImplementedError
+
+    def result(self):
+        """Return JSON serializable result of the analysis."""
+        raise NotImplementedError
+
+
+class LineWordCount(StreamProcessor):
+    """Count lines and whitespace separated words.
+
+    Content is decoded as UTF-8, invalid bytes are replaced, and words are
+    separated by any Unicode whitespace, like :meth:`str.split` does.
+
+    """
+
+    name = 'counts'
+
+    def __init__(self):
+        """Initialize counters."""
+        self.lines = 0
+        self.words = 0
+        self.last_byte = b''
+        self.last_char = ''
+        # Multibyte characters may be split between two chunks.
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def count_words(self, text):
+        """Count words of the next decoded ``text``."""
+        if not text:
+            return
+
+        self.words += len(text.split())
+        # Do not count a word split between two chunks twice.
+        if self.last_char and not self.last_char.isspace():
+            if not text[0].isspace():
+                self.words -= 1
+        self.last_char = text[-1]
+
+    def update(self, chunk):
+        """Process the next ``chunk`` of the upload."""
+        if not chunk:
+            return
+
+        self.lines += chunk.count(b'\n')
+        self.count_words(self.decoder.decode(chunk))
+        self.last_byte = chunk[-1:]
+
+    def result(self):
+        """Return line and word counts."""
+        self.count_words(self.decoder.decode(b'', final=True))
+        lines = self.lines
+        if self.last_byte and self.last_byte != b'\n':
+            # The last line is not terminated.
+            lines += 1
+        return {'lines': lines, 'words': self.words}
+
+
+class FormatSniffer(StreamProcessor):
+    """Guess file format from its leading bytes."""
+
+    name = 'format'
+
+    head_size = 512
+
+    signatures = (
+        (b'\x1f\x8b', 'gzip'),
+        (b'BZh', 'bzip2'),
+        (b'\xfd7zXZ\x00', 'xz'),
+        (b'PK\x03\x04', 'zip'),
+        (b'%PDF', 'pdf'),
+        (b'\x89PNG\r\n\x1a\n', 'png'),
+        (b'\xff\xd8\xff', 'jpeg'),
+        (b'\x89HDF\r\n\x1a\n', 'hdf5'),
+    )
+
+    def __init__(self):
+        """Initialize buffer."""
+        self.head = b''
+
+    def update(self, chunk):
+        """Process the next ``chunk`` of the upload."""
+        if len(self.head) < self.head_size:
+            self.head += chunk[: self.head_size - len(self.head)]
+
+    def result(self):
+        """Return name of the detected format."""
+        for signature, name in self.signatures:
+            if self.head.startswith(signature):
+                return name
+
+        if b'\x00' in self.head:
+            return 'binary'
+
+        try:
+            self.head.decode('utf-8')
+        except UnicodeDecodeError as error:
+            # A multibyte character may be cut at the end of the head.
+            if error.start < len(self.head) - 3:
+                return 'binary'
+
+        return 'text'
+
+
+class GzipValidator(StreamProcessor):
+    """Check integrity of gzip compressed uploads.
+
+    Result is ``None`` for uploads that are not gzip compressed.
+
+    """
+
+    name = 'gzip'
+
+    def __init__(self):
+        """Initialize decompressor."""
+        self.head = b''
+        self.is_gzip = None
+        self.decompressor = None
+        self.uncompressed_size = 0
+        self.error = None
+
+    def update(self, chunk):
+        """Process the next ``chunk`` of the upload."""
+        if self.is_gzip is None:
+            buffered = self.head
+            self.head += chunk[: 2 - len(self.head)]
+            if len(self.head) < 2:
+                return
+
+            self.is_gzip = self.head == b'\x1f\x8b'
+            if self.is_gzip:
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                chunk = buffered + chunk
+
+        if not self.is_gzip or self.error is not None:
+            return
+
+        try:
+            pending = True
+            while True:
+                if self.decompressor.eof:
+                    # Data following the end of a gzip member.
+                    chunk = self.decompressor.unused_data + chunk
+                    if not chunk.strip(b'\x00'):
+                        # Trailing zero padding.
+                        return
+                    self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                elif not chunk and not pending:
+                    return
+
+                data = self.decompressor.decompress(chunk, DECOMPRESS_BLOCK_SIZE)
+                self.uncompressed_size += len(data)
+                chunk = self.decompressor.unconsumed_tail
+                # More output may be pending when the block is full.
+                pending = len(data) == DECOMPRESS_BLOCK_SIZE
+        except zlib.error as error:
+            self.error = str(error)
+
+    def result(self):
+        """Return validation result."""
+        if not self.is_gzip:
+            return None
+
+        if self.error is None and not self.decompressor.eof:
+            self.error = "Truncated gzip stream."
+
+        return {
+            'valid': self.error is None,
+            'error': self.error,
+            'uncompressed_size': self.uncompressed_size,
+        }
+
+
+class Sha256Digest(StreamProcessor):
+    """Compute SHA-256 digest of the upload."""
+
+    name = 'sha256'
+
+    def __init__(self):
+        """Initialize hasher."""
+        self.hasher = hashlib.sha256()
+
+    def update(self, chunk):
+        """Process the next ``chunk`` of the upload."""
+        self.hasher.update(chunk)
+
+    def result(self):
+        """Return hex digest."""
+        return self.hasher.hexdigest()
+
+
+class AnalysisPipeline:
+    """Feed consecutive chunks of an upload to stream processors."""
+
+    def __init__(self, processor_classes):
+        """Initialize processors."""
+        self.processors = [processor_class() for processor_class in processor_classes]
+        self.offset = 0
+
+    def feed(self, chunk):
+        """Feed ``chunk`` to all processors."""
+        for processor in self.processors:
+            processor.update(chunk)
+        self.offset += len(chunk)
+
+    def feed_file(self, handle, end):
+        """Feed the contents of ``handle`` from the current offset to ``end``."""
+        handle.seek(self.offset)
+        while self.offset < end:
+            block = handle.read(min(READ_BLOCK_SIZE, end - self.offset))
+            if not block:
+                break
+            self.feed(block)
+
+    def results(self):
+        """Return results of all processors."""
+        return {processor.name: processor.result() for processor in self.processors}
+
+
+class AnalysingWriter:
+    """File wrapper that feeds written data to an analysis pipeline."""
+
+    def __init__(self, handle, pipeline):
+        """Wrap file ``handle``."""
+        self.handle = handle
+        self.pipeline = pipeline
+
+    def write(self, data):
+        """Write ``data`` to file and feed it to the pipeline."""
+        written = self.handle.write(data)
+        self.pipeline.feed(data)
+        return written
+
+
+_pipelines = OrderedDict()  # pylint: disable=invalid-name
+_pipelines_lock = threading.Lock()  # pylint: disable=invalid-name
+
+
+def get_pipeline(upload_id, offset, processor_classes):
+    """Return pipeline of upload ``upload_id`` expecting data at ``offset``.
+
+    Return ``None`` if data at ``offset`` cannot be analysed while it is
+    being written, because earlier data has not been seen by this
+    process or has already been analysed.
+
+    """
+    with _pipelines_lock:
+        pipeline = _pipelines.get(upload_id)
+        if pipeline is None and offset == 0:
+            pipeline = AnalysisPipeline(processor_classes)
+            _pipelines[upload_id] = pipeline
+            while len(_pipelines) > MAX_PIPELINES:
+                _pipelines.popitem(last=False)
+
+        if pipeline is None or pipeline.offset != offset:
+            return None
+
+        _pipelines.move_to_end(upload_id)
+        return pipeline
+
+
+def finish(upload_id, filetemp, size, processor_classes):
+    """Complete analysis of upload ``upload_id`` and store the results.
+
+    Data that has not been seen while the upload was streaming is read
+    from ``filetemp``.
+
+    """
+    with _pipelines_lock:
+        pipeline = _pipelines.pop(upload_id, None)
+
+    if pipeline is None or pipeline.offset > size:
+        pipeline = AnalysisPipeline(processor_classes)
+
+    if pipeline.offset < size:
+        with open(filetemp, 'rb') as handle:
+            pipeline.feed_file(handle, size)
+
+    results = pipeline.results()
+    with open(analysis_path(filetemp), 'w') as handle:
+        json.dump(results, handle)
+
+    return results
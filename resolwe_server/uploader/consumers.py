@@ -0,0 +1,97 @@
+"""Channels consumers."""
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from django.contrib.auth.models import AnonymousUser
+
+from resolwe.flow.models import Data
+
+from . import watcher
+
+# Exports.
+__all__ = ('DataFilesConsumer',)
+
+
+def can_download(user, data_id):
+    """Return whether ``user`` may download files of Data object ``data_id``."""
+    try:
+        data = Data.objects.get(pk=data_id)
+    except Data.DoesNotExist:
+        return False
+
+    for candidate in (AnonymousUser(), user):
+        if candidate.has_perm('view_data', data) and candidate.has_perm(
+            'download_data', data
+        ):
+            return True
+    return False
+
+
+class DataFilesConsumer(AsyncJsonWebsocketConsumer):
+    """Send files of a Data object and their changes.
+
+    After connecting, the client receives a ``files`` message with all
+    entries of the Data directory, followed by ``changes`` messages with
+    ``added``, ``changed`` and ``removed`` entries. Changes may repeat
+    entries already in the listing, so clients apply them as updates.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize consumer."""
+        super().__init__(*args, **kwargs)
+        self.data_id = None
+        self.heartbeat = None
+
+    @property
+    def groups(self):
+        """Groups this channel should add itself to."""
+        if self.data_id is None:
+            return []
+
+        return [watcher.GROUP.format(self.data_id)]
+
+    async def connect(self):
+        """Check permissions and send the current files."""
+        data_id = self.scope['url_route']['kwargs']['data_id']
+        user = self.scope.get('user') or AnonymousUser()
+        if not await database_sync_to_async(can_download)(user, data_id):
+            await self.close()
+            return
+
+        # Join the group before listing, so that no change is missed.
+        self.data_id = data_id
+        await self.channel_layer.group_add(
+            watcher.GROUP.format(data_id), self.channel_name
+        )
+        await self.accept()
+
+        await sync_to_async(watcher.subscribe)(data_id)
+        self.heartbeat = asyncio.ensure_future(self.refresh_subscription())
+
+        entries = await sync_to_async(watcher.list_tree)(watcher.get_data_dir(data_id))
+        await self.send_json(
+            {'msg': 'files', 'data_id': data_id, 'files': list(entries.values())}
+        )
+
+    async def refresh_subscription(self):
+        """Keep the watcher watching files while connected."""
+        while True:
+            await asyncio.sleep(watcher.get_setting('HEARTBEAT'))
+            await sync_to_async(watcher.subscribe)(self.data_id)
+
+    async def disconnect(self, code):
+        """Stop refreshing the subscription."""
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+            self.heartbeat = None
+
+    async def files_changes(self, message):
+        """Called when changes are received from the watcher."""
+        await self.send_json(
+            {'msg': 'changes', 'data_id': self.data_id, 'changes': message['changes']}
+        )
@@ -9,6 +9,10 @@ import shutil
 
 from resolwe.utils import BraceMessage as __
 
+from . import analysis
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
 
 def get_upload_id(session_id, file_uid, secret_key):
     """Return the session identifier used by the request."""
@@ -62,7 +66,14 @@ def _remove_file(fn):
 
 
 def uploader(
-    request_method, post_data, session_id, file_uid, secret_key, upload_dir, response
+    request_method,
+    post_data,
+    session_id,
+    file_uid,
+    secret_key,
+    upload_dir,
+    response,
+    processors=(),
 ):
     """Receive uploaded chunks and combine them into one file.
 
@@ -84,14 +95,17 @@ def uploader(
         will be placed
     :param func respone: function that generate appropriate HTTP
         response based on the environment where function runs
+    :param list processors: stream processor classes that analyse the
+        uploaded file while it is written, see
+        :mod:`resolwe_server.uploader.analysis`
     """
     if request_method not in ['GET', 'POST']:
-        logging.warning(__("Invalid HTTP request method: '{}'."), request_method)
+        logger.warning(__("Invalid HTTP request method: '{}'.", request_method))
         return response(405)
 
     if session_id is None or file_uid is None:
         msg = "Session-Id and X-File-Uid must be given in header"
-        logging.warning(msg)
+        logger.warning(msg)
         return response(400, msg)
 
     upload_id = get_upload_id(session_id, file_uid, secret_key)
@@ -112,9 +126,14 @@ def uploader(
             with open(filetemp, 'wb') as f:
                 f.truncate(content_total)
 
+        pipeline = None
+        if processors:
+            pipeline = analysis.get_pipeline(upload_id, content_from, processors)
+
         with open(filetemp, 'r+b') as f:
             f.seek(content_from)
-            shutil.copyfileobj(post_data['file'], f, 1024 * 1024)
+            target = f if pipeline is None else analysis.AnalysingWriter(f, pipeline)
+            shutil.copyfileobj(post_data['file'], target, 1024 * 1024)
 
         new_offset = max(content_to, offset)
         push_offset(filetemp, new_offset)
@@ -123,25 +142,29 @@ def uploader(
             data = json.dumps({'resume_offset': new_offset})
             return response(201, data)
         elif new_offset == content_total:
-            data = json.dumps(
-                {
-                    'files': [
-                        {
-                            'name': post_data['filename'],
-                            'temp': upload_id,
-                            'size': content_total,
-                            'done': True,
-                        }
-                    ]
-                }
-            )
+            file_info = {
+                'name': post_data['filename'],
+                'temp': upload_id,
+                'size': content_total,
+                'done': True,
+            }
+            if processors:
+                try:
+                    file_info['analysis'] = analysis.finish(
+                        upload_id, filetemp, content_total, processors
+                    )
+                except (IOError, ValueError) as error:
+                    # Processes fall back to reading the file. Decoding
+                    # errors (UnicodeDecodeError) are also ValueErrors.
+                    logger.warning(__("Upload analysis failed: {}", error))
+            data = json.dumps({'files': [file_info]})
             _remove_file(filetemp + '.status')
             return response(200, data)
         else:
             msg = "Upload failed: content overflow."
-            logging.warning(msg)
+            logger.warning(msg)
             return response(400, msg)
 
     except Exception as unknown_e:  # pylint: disable=broad-except
-        logging.error(__("Unexpected error occured: {}", unknown_e))
+        logger.error(__("Unexpected error occured: {}", unknown_e))
         return response(500)
@@ -1,7 +1,6 @@
 """Django views."""
 import base64
 from datetime import datetime
-import json
 import logging
 import os
 import re
@@ -18,7 +17,9 @@ from django.http import (
     Http404,
 )
 from django.shortcuts import redirect
+from django.utils.module_loading import import_string
 
+from ..base.renderers import StreamingJSONResponse
 from ..base.views import authorization
 
 from .utils import uploader, get_upload_id, _remove_file
@@ -30,6 +31,40 @@ __all__ = ('file_upload', 'file_download')
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
+def get_upload_processors():
+    """Return stream processor classes configured for uploads."""
+    return [
+        import_string(path)
+        for path in getattr(settings, 'UPLOAD_STREAM_PROCESSORS', [])
+    ]
+
+
+def _list_directory(path):
+    """Yield stats of directories in ``path`` followed by stats of files."""
+    for list_files in (False, True):
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_file = entry.is_file()
+                    if is_file != list_files:
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Removed while listing.
+                    continue
+
+                modified = datetime.utcfromtimestamp(stat.st_mtime)
+                stat_obj = {
+                    'name': entry.name,
+                    'type': "file" if is_file else "directory",
+                    'mtime': modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+                }
+                if is_file:
+                    stat_obj['size'] = stat.st_size
+
+                yield stat_obj
+
+
 def upload_lock(upload_function):
     """Prevent upload of the same file in multiple threads."""
 
@@ -107,6 +142,7 @@ def file_upload(request):
         secret_key,
         upload_dir,
         response_func,
+        processors=get_upload_processors(),
     )
 
 
@@ -157,27 +193,9 @@ def file_download(request, data_id, uri, token=None, gzip_header=False):
         if uri != '' and not uri.endswith('/'):
             return redirect(uri + '/')
 
-        files, dirs = [], []
-        for fn in os.listdir(filename):
-            file_path = os.path.join(filename, fn)
-            is_file = os.path.isfile(file_path)
-
-            stat = os.stat(file_path)
-            modified = datetime.utcfromtimestamp(stat.st_mtime)
-
-            stat_obj = {
-                'name': fn,
-                'type': "file" if is_file else "directory",
-                'mtime': modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
-            }
-
-            if is_file:
-                stat_obj['size'] = stat.st_size
-                files.append(stat_obj)
-            else:
-                dirs.append(stat_obj)
-
-        return HttpResponse(json.dumps(dirs + files), content_type="application/json")
+        # Entries are streamed, so large directories are never listed
+        # in memory at once.
+        return StreamingJSONResponse(_list_directory(filename))
 
     if gzip_header:
         # Check by magic number if file is really gzipped
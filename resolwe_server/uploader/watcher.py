@@ -0,0 +1,367 @@
+"""Watch files of Data objects and publish their changes.
+
+Websocket consumers register the Data objects their clients watch in a
+Redis sorted set and refresh the registration while connected. The
+watcher, run by the ``watch_data_files`` management command, watches the
+directories of registered Data objects under ``FLOW_EXECUTOR['DATA_DIR']``
+and sends added, changed and removed entries to the channel layer group
+of each Data object.
+
+Changes are detected with inotify when ``inotify_simple`` is installed
+and by periodically rescanning the directories otherwise. Changes are
+collected for a short time and compared to the last known state of the
+directory, so a file that is written many times is reported once.
+
+"""
+from datetime import datetime
+import logging
+import os
+import time
+
+from asgiref.sync import async_to_sync
+
+from channels.layers import get_channel_layer
+
+from django.conf import settings
+
+from resolwe.utils import BraceMessage as __
+
+from ..base.redis_clients import get_redis
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None  # pylint: disable=invalid-name
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULTS = {
+    # Change detection: 'inotify', 'polling' or 'auto' to use inotify
+    # when available.
+    'BACKEND': 'auto',
+    # Seconds between rescans of the polling backend.
+    'POLL_INTERVAL': 1.0,
+    # Changes are collected for this many seconds before they are sent.
+    'DEBOUNCE': 0.5,
+    # Seconds between refreshes of registrations by consumers.
+    'HEARTBEAT': 30,
+}
+
+SUBSCRIPTIONS_KEY = 'data-files:subscriptions'
+GROUP = 'data-files.{}'
+
+# Seconds between reads of registrations by the watcher.
+SUBSCRIPTIONS_INTERVAL = 2
+
+# Maximum number of changes in a channel layer message.
+MAX_CHANGES_PER_MESSAGE = 100
+
+
+def get_setting(name):
+    """Return file watcher setting ``name``."""
+    return getattr(settings, 'DATA_FILES_WATCHER', {}).get(name, DEFAULTS[name])
+
+
+def get_data_dir(data_id):
+    """Return directory of Data object ``data_id``."""
+    return os.path.join(settings.FLOW_EXECUTOR['DATA_DIR'], str(data_id))
+
+
+def subscribe(data_id):
+    """Register or refresh a client watching files of ``data_id``."""
+    get_redis(key=SUBSCRIPTIONS_KEY).zadd(SUBSCRIPTIONS_KEY, {str(data_id): time.time()})
+
+
+def get_subscriptions():
+    """Return identifiers of Data objects with registered clients."""
+    client = get_redis(key=SUBSCRIPTIONS_KEY)
+    # Registrations of clients that stopped refreshing them expire.
+    expired = time.time() - 3 * get_setting('HEARTBEAT')
+    client.zremrangebyscore(SUBSCRIPTIONS_KEY, '-inf', expired)
+    return {int(data_id) for data_id in client.zrange(SUBSCRIPTIONS_KEY, 0, -1)}
+
+
+def stat_entry(relative_path, stat, is_file):
+    """Return listing entry of a file or directory."""
+    modified = datetime.utcfromtimestamp(stat.st_mtime)
+    entry = {
+        'path': relative_path,
+        'type': "file" if is_file else "directory",
+        'mtime': modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+    }
+    if is_file:
+        entry['size'] = stat.st_size
+    return entry
+
+
+def list_tree(root, relative_path=''):
+    """Return entries of ``relative_path`` in ``root`` and everything below it.
+
+    Entries are keyed by their path relative to ``root``. The root itself
+    is not listed.
+
+    """
+    entries = {}
+    path = os.path.join(root, relative_path)
+    if relative_path:
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return entries
+        is_file = os.path.islink(path) or not os.path.isdir(path)
+        entries[relative_path] = stat_entry(relative_path, stat, is_file)
+        if is_file:
+            return entries
+
+    directories = [relative_path]
+    while directories:
+        directory = directories.pop()
+        try:
+            with os.scandir(os.path.join(root, directory)) as listing:
+                for entry in listing:
+                    entry_path = os.path.join(directory, entry.name)
+                    try:
+                        is_file = not entry.is_dir(follow_symlinks=False)
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # Removed while listing.
+                        continue
+                    entries[entry_path] = stat_entry(entry_path, stat, is_file)
+                    if not is_file:
+                        directories.append(entry_path)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+    return entries
+
+
+def _is_below(path, parent):
+    """Return whether ``path`` is ``parent`` or inside it."""
+    return not parent or path == parent or path.startswith(parent + os.sep)
+
+
+class DataTree:
+    """Last known files of a Data object.
+
+    The tree starts empty, so its first update reports all existing
+    entries as added.
+
+    """
+
+    def __init__(self, data_id):
+        """Initialize tree."""
+        self.data_id = data_id
+        self.root = get_data_dir(data_id)
+        self.entries = {}
+
+    def update(self, relative_path=''):
+        """Update entries below ``relative_path`` and return their changes."""
+        current = list_tree(self.root, relative_path)
+        previous = {
+            path: entry
+            for path, entry in self.entries.items()
+            if _is_below(path, relative_path)
+        }
+
+        changes = []
+        for path, entry in previous.items():
+            if path not in current:
+                del self.entries[path]
+                changes.append(
+                    {'msg': 'removed', 'path': path, 'type': entry['type']}
+                )
+        for path, entry in current.items():
+            if path not in previous:
+                changes.append(dict(entry, msg='added'))
+            elif entry != previous[path]:
+                changes.append(dict(entry, msg='changed'))
+            self.entries[path] = entry
+
+        return changes
+
+    def directories(self):
+        """Return relative paths of known directories, including the root."""
+        return [''] + [
+            path for path, entry in self.entries.items() if entry['type'] == 'directory'
+        ]
+
+
+class Watcher:
+    """Watch files of Data objects with registered clients."""
+
+    # Events of watched directories.
+    inotify_mask = (
+        inotify_simple.flags.CREATE
+        | inotify_simple.flags.DELETE
+        | inotify_simple.flags.MODIFY
+        | inotify_simple.flags.CLOSE_WRITE
+        | inotify_simple.flags.ATTRIB
+        | inotify_simple.flags.MOVED_FROM
+        | inotify_simple.flags.MOVED_TO
+        | inotify_simple.flags.DELETE_SELF
+        | inotify_simple.flags.ONLYDIR
+        if inotify_simple is not None
+        else 0
+    )
+
+    def __init__(self, backend=None):
+        """Initialize watcher."""
+        backend = backend or get_setting('BACKEND')
+        if backend == 'auto':
+            backend = 'inotify' if inotify_simple is not None else 'polling'
+        if backend == 'inotify' and inotify_simple is None:
+            raise ValueError("The inotify backend requires the inotify_simple package.")
+        self.backend = backend
+
+        self.inotify = inotify_simple.INotify() if backend == 'inotify' else None
+        # Watch descriptors by Data object and relative path and vice versa.
+        self.descriptors = {}
+        self.paths = {}
+
+        self.trees = {}
+        self.dirty = {}
+        self.first_dirty = None
+        self.subscriptions_read = 0
+        self.channel_layer = get_channel_layer()
+
+    def run(self):
+        """Watch files until interrupted."""
+        logger.info(__("Watching files of Data objects with the {} backend.", self.backend))
+        while True:
+            now = time.monotonic()
+            if now - self.subscriptions_read >= SUBSCRIPTIONS_INTERVAL:
+                self.update_subscriptions()
+                self.subscriptions_read = now
+
+            if self.inotify is not None:
+                self.read_events()
+            else:
+                time.sleep(get_setting('POLL_INTERVAL'))
+                for data_id in self.trees:
+                    self.mark_dirty(data_id, '')
+
+            if (
+                self.first_dirty is not None
+                and time.monotonic() - self.first_dirty >= get_setting('DEBOUNCE')
+            ):
+                self.publish_changes()
+
+    def update_subscriptions(self):
+        """Start and stop watching Data objects as clients come and go."""
+        try:
+            subscriptions = get_subscriptions()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(__("Reading file watcher subscriptions failed: {}", error))
+            return
+
+        for data_id in set(self.trees) - subscriptions:
+            self.unwatch(data_id)
+
+        for data_id in subscriptions - set(self.trees):
+            # Directories of new Data objects are created by the executor.
+            if os.path.isdir(get_data_dir(data_id)):
+                self.trees[data_id] = DataTree(data_id)
+                self.add_watches(data_id)
+                # Files created since clients listed the directory are sent
+                # with the first changes.
+                self.mark_dirty(data_id, '')
+
+    def add_watches(self, data_id):
+        """Watch directories of ``data_id`` that are not watched yet."""
+        if self.inotify is None:
+            return
+
+        tree = self.trees[data_id]
+        for relative_path in tree.directories():
+            if (data_id, relative_path) in self.descriptors:
+                continue
+            try:
+                descriptor = self.inotify.add_watch(
+                    os.path.join(tree.root, relative_path), self.inotify_mask
+                )
+            except OSError:
+                # Removed in the meantime, the removal is reported.
+                continue
+            self.descriptors[(data_id, relative_path)] = descriptor
+            self.paths[descriptor] = (data_id, relative_path)
+
+    def unwatch(self, data_id):
+        """Stop watching ``data_id``."""
+        self.trees.pop(data_id, None)
+        self.dirty.pop(data_id, None)
+        for key in [key for key in self.descriptors if key[0] == data_id]:
+            descriptor = self.descriptors.pop(key)
+            self.paths.pop(descriptor, None)
+            try:
+                self.inotify.rm_watch(descriptor)
+            except OSError:
+                # The directory has been removed.
+                pass
+
+    def read_events(self):
+        """Read inotify events and mark changed paths."""
+        timeout = get_setting('DEBOUNCE') if self.first_dirty is not None else 1
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            flags = inotify_simple.flags.from_mask(event.mask)
+            if inotify_simple.flags.Q_OVERFLOW in flags:
+                logger.warning("Inotify event queue overflowed, rescanning.")
+                for data_id in self.trees:
+                    self.mark_dirty(data_id, '')
+                continue
+
+            if event.wd not in self.paths:
+                continue
+            data_id, directory = self.paths[event.wd]
+
+            if inotify_simple.flags.IGNORED in flags:
+                # The directory has been removed.
+                del self.paths[event.wd]
+                self.descriptors.pop((data_id, directory), None)
+                continue
+
+            self.mark_dirty(data_id, os.path.join(directory, event.name))
+
+    def mark_dirty(self, data_id, relative_path):
+        """Mark ``relative_path`` of ``data_id`` as changed."""
+        relative_path = relative_path.rstrip(os.sep)
+        self.dirty.setdefault(data_id, set()).add(relative_path)
+        if self.first_dirty is None:
+            self.first_dirty = time.monotonic()
+
+    def publish_changes(self):
+        """Send changes of marked paths to clients."""
+        dirty, self.dirty = self.dirty, {}
+        self.first_dirty = None
+
+        for data_id, paths in dirty.items():
+            tree = self.trees.get(data_id)
+            if tree is None:
+                continue
+
+            changes = []
+            for relative_path in sorted(paths):
+                # Paths below an updated directory are updated with it.
+                if any(
+                    _is_below(relative_path, parent)
+                    for parent in paths
+                    if parent != relative_path
+                ):
+                    continue
+                changes.extend(tree.update(relative_path))
+
+            if not changes:
+                continue
+
+            self.add_watches(data_id)
+            for start in range(0, len(changes), MAX_CHANGES_PER_MESSAGE):
+                try:
+                    async_to_sync(self.channel_layer.group_send)(
+                        GROUP.format(data_id),
+                        {
+                            'type': 'files.changes',
+                            'changes': changes[start : start + MAX_CHANGES_PER_MESSAGE],
+                        },
+                    )
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.warning(__("Sending file changes failed: {}", error))
+                    break
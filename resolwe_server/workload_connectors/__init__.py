@@ -0,0 +1 @@
+"""Workload connectors."""
@@ -0,0 +1,167 @@
+"""Local process pool connector.
+
+Executors of lightweight processes, listed in the ``FLOW_LOCAL_POOL``
+setting, are run by a pool of local worker processes instead of being sent
+through Celery. Workers are forked from a server process that has already
+imported the modules listed under ``PRELOAD``, and run executors
+in-process, so a job does not pay for starting the interpreter of its
+executor and for the Celery round trip.
+
+Only the executor is run warm. It is the executor configured in
+``FLOW_EXECUTOR['NAME']``, which starts the program of the process as
+usual, e.g. in a Docker container with the Docker executor, and Python
+processes in their own interpreter. The pool therefore helps processes
+whose run time is dominated by dispatching them, and is best combined
+with the local executor on development and CI machines, where the tools
+of the processes are installed locally.
+
+All other processes are passed to the ``FALLBACK`` connector. Select this
+connector in ``FLOW_MANAGER['DISPATCHER_MAPPING']``.
+
+"""
+import asyncio
+from importlib import import_module
+import logging
+import multiprocessing
+import os
+import re
+import runpy
+import subprocess
+import sys
+import threading
+
+from django.conf import settings
+
+from resolwe.flow.managers.workload_connectors.base import BaseConnector
+from resolwe.utils import BraceMessage as __
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULTS = {
+    # Slugs of processes run by the pool.
+    'PROCESSES': [],
+    # Number of worker processes.
+    'WORKERS': 4,
+    # Number of jobs after which a worker is replaced by a fresh one.
+    'MAX_JOBS_PER_WORKER': 100,
+    # Modules imported once by the server the workers are forked from.
+    'PRELOAD': ['aioredis', 'asyncio', 'json', 'shlex'],
+    # Connector running all other processes.
+    'FALLBACK': 'resolwe_server.workload_connectors.priority',
+}
+
+# The executor command at the end of the argument vector of the manager.
+EXECUTOR_COMMAND = re.compile(r' -m executors (\.\w+)$')
+
+
+def get_setting(name):
+    """Return local pool setting ``name``."""
+    return getattr(settings, 'FLOW_LOCAL_POOL', {}).get(name, DEFAULTS[name])
+
+
+def _run_subprocess(runtime_dir, argv):
+    """Run executor in a new process and return its exit code."""
+    return subprocess.Popen(argv, cwd=runtime_dir, stdin=subprocess.DEVNULL).wait()
+
+
+def run_executor(runtime_dir, argv):
+    """Run the executor in ``runtime_dir`` and return its exit code.
+
+    The executor package copied to ``runtime_dir`` is imported and run in
+    this process with the executor given in ``argv``. Any state it leaves
+    behind is cleaned up, so the worker can run the next job.
+
+    """
+    command = argv[-1] if argv[:2] == ['/bin/bash', '-c'] else ''
+    match = EXECUTOR_COMMAND.search(command)
+    if not match:
+        return _run_subprocess(runtime_dir, argv)
+
+    cwd, path, sys_argv = os.getcwd(), list(sys.path), list(sys.argv)
+    root_logger = logging.getLogger()
+    handlers, level = list(root_logger.handlers), root_logger.level
+
+    os.chdir(runtime_dir)
+    sys.path.insert(0, runtime_dir)
+    sys.argv = ['executors', match.group(1)]
+    # The executor closes its event loop when done.
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    try:
+        runpy.run_module('executors', run_name='__main__', alter_sys=True)
+        return 0
+    except SystemExit as error:
+        return error.code if isinstance(error.code, int) else 1
+    finally:
+        os.chdir(cwd)
+        sys.path[:] = path
+        sys.argv = sys_argv
+        root_logger.handlers = handlers
+        root_logger.setLevel(level)
+        # Each job has its own copy of the executor package and settings.
+        for name in list(sys.modules):
+            if name == 'executors' or name.startswith('executors.'):
+                del sys.modules[name]
+
+
+class Connector(BaseConnector):
+    """Connector running lightweight processes in a local pool."""
+
+    def __init__(self):
+        """Initialize connector."""
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.fallback = import_module(get_setting('FALLBACK')).Connector()
+
+    def get_pool(self):
+        """Return worker pool, starting it on first use."""
+        with self.pool_lock:
+            if self.pool is None:
+                # Workers are not forked from the manager, whose event
+                # loop and connections must not be shared.
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(get_setting('PRELOAD'))
+                self.pool = context.Pool(
+                    processes=get_setting('WORKERS'),
+                    maxtasksperchild=get_setting('MAX_JOBS_PER_WORKER'),
+                )
+            return self.pool
+
+    def submit(self, data, runtime_dir, argv):
+        """Run process.
+
+        For details, see
+        :meth:`~resolwe.flow.managers.workload_connectors.base.BaseConnector.submit`.
+        """
+        if data.process.slug not in get_setting('PROCESSES'):
+            return self.fallback.submit(data, runtime_dir, argv)
+
+        logger.debug(
+            __(
+                "Connector '{}' running for Data with id {} ({}) in the local pool.",
+                self.__class__.__module__,
+                data.id,
+                repr(argv),
+            )
+        )
+
+        data_id = data.id
+
+        def done(code):
+            """Log failed executors."""
+            if code:
+                logger.error(
+                    __("Executor for Data with id {} exited with {}.", data_id, code)
+                )
+
+        def failed(error):
+            """Log executors that could not be run."""
+            logger.error(
+                __("Running executor for Data with id {} failed: {}", data_id, error)
+            )
+
+        self.get_pool().apply_async(
+            run_executor,
+            (runtime_dir, argv),
+            callback=done,
+            error_callback=failed,
+        )
@@ -0,0 +1,106 @@
+"""Priority-aware Celery connector.
+
+Interactive and batch processes are sent to separate Celery queues, so
+that batch runs never delay interactive processes on workers reserved for
+them. Within a queue, jobs are ordered by priority. Batch jobs of users
+with many jobs already scheduled get lower priorities, so each user gets
+a fair share of the batch workers.
+
+Select it in ``FLOW_MANAGER['DISPATCHER_MAPPING']`` and configure it with
+the ``FLOW_PRIORITY`` setting.
+
+"""
+import logging
+
+from django.conf import settings
+
+from resolwe.flow.managers.workload_connectors.base import BaseConnector
+from resolwe.flow.models import Data, Process
+from resolwe.flow.tasks import celery_run
+from resolwe.utils import BraceMessage as __
+
+from resolwe_server.celery import (
+    PRIORITY_HIGHEST,
+    PRIORITY_LOWEST,
+    QUEUE_BATCH,
+    QUEUE_INTERACTIVE,
+)
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULTS = {
+    # Priorities of scheduling classes.
+    'INTERACTIVE': PRIORITY_HIGHEST,
+    'BATCH': 5,
+    # Priorities of processes by slug, overriding the class priorities.
+    'PROCESSES': {},
+    # Number of scheduled batch jobs of a user above which the priority
+    # of further jobs is lowered by one level for each such number of jobs.
+    'FAIR_SHARE_LIMIT': 20,
+}
+
+
+def get_setting(name):
+    """Return priority setting ``name``."""
+    return getattr(settings, 'FLOW_PRIORITY', {}).get(name, DEFAULTS[name])
+
+
+def get_active_jobs(data):
+    """Return number of other scheduled batch jobs of the contributor of ``data``."""
+    return (
+        Data.objects.filter(
+            contributor_id=data.contributor_id,
+            status__in=[Data.STATUS_WAITING, Data.STATUS_PROCESSING],
+            scheduled__isnull=False,
+            process__scheduling_class=Process.SCHEDULING_CLASS_BATCH,
+        )
+        .exclude(pk=data.pk)
+        .count()
+    )
+
+
+def get_priority(data):
+    """Return Celery priority of the job processing ``data``."""
+    priorities = get_setting('PROCESSES')
+    if data.process.slug in priorities:
+        return priorities[data.process.slug]
+
+    if data.process.scheduling_class == Process.SCHEDULING_CLASS_INTERACTIVE:
+        return get_setting('INTERACTIVE')
+
+    priority = get_setting('BATCH')
+    limit = get_setting('FAIR_SHARE_LIMIT')
+    if limit:
+        priority += get_active_jobs(data) // limit
+
+    return min(priority, PRIORITY_LOWEST)
+
+
+class Connector(BaseConnector):
+    """Celery connector with per-class queues and priorities."""
+
+    def submit(self, data, runtime_dir, argv):
+        """Run process.
+
+        For details, see
+        :meth:`~resolwe.flow.managers.workload_connectors.base.BaseConnector.submit`.
+        """
+        queue = QUEUE_BATCH
+        if data.process.scheduling_class == Process.SCHEDULING_CLASS_INTERACTIVE:
+            queue = QUEUE_INTERACTIVE
+        priority = get_priority(data)
+
+        logger.debug(
+            __(
+                "Connector '{}' running for Data with id {} ({}) in celery queue {} "
+                "with priority {}.",
+                self.__class__.__module__,
+                data.id,
+                repr(argv),
+                queue,
+                priority,
+            )
+        )
+        celery_run.apply_async(
+            (data.id, runtime_dir, argv), queue=queue, priority=priority
+        )